@@ -1,5 +1,6 @@
 from pathlib import Path
 import os
+import json
 import mimetypes
 import urllib.parse
 from aiohttp import web
@@ -10,7 +11,10 @@ import server
 
 from .multi_scheduled_lora_loader import MultiScheduledLoraLoader
 from .visual_prompt_gallery import VisualPromptGallery
-from .modules.lora_ops import LoraOps
+from .modules.lora_ops import LoraOps, MadPatcherOverrides
+from .modules.safetensors_io import HeaderCache
+from .modules.sidecar_cache import SidecarCache
+from .modules.settings import env_flag, env_int
 
 NODE_DIR_NAME = Path(__file__).parent.name
 LOG_PREFIX = f"[{NODE_DIR_NAME}]"
@@ -27,6 +31,12 @@ NODE_DISPLAY_NAME_MAPPINGS = {
 
 
 executor = ThreadPoolExecutor(max_workers=2)
+bulk_executor = ThreadPoolExecutor(
+    max_workers=max(1, env_int("BULK_WORKERS", min(32, (os.cpu_count() or 1) + 4))),
+    thread_name_prefix="mad-nodes-bulk",
+)
+
+INSPECT_BATCH_LIMIT = 1000
 
 PACKAGE_NAME = "PROJECT-MAD-NODES"
 WEB_DIRECTORY = "./js"
@@ -282,9 +292,10 @@ async def inspect_lora(request):
     """
 
     if request.rel_url.query.get("clear_cache_all", "false").lower() == "true":
-        from .multi_scheduled_lora_loader import _LORA_CACHE
+        from .multi_scheduled_lora_loader import _LORA_CACHE, _LORA_TENSOR_CACHE
 
         _LORA_CACHE.clear()
+        _LORA_TENSOR_CACHE.invalidate()
         return web.json_response(
             {"status": "cleared", "message": "Global LoRA cache cleared."}
         )
@@ -293,6 +304,8 @@ async def inspect_lora(request):
 
     refresh_param = request.rel_url.query.get("refresh", "false").lower()
     force_refresh = refresh_param in ["true", "1", "yes"]
+    energy_param = request.rel_url.query.get("energy", "tensor").lower()
+    effective = energy_param == "effective"
 
     if not lora_name:
         return web.json_response({"arch": "UNKNOWN"})
@@ -315,12 +328,17 @@ async def inspect_lora(request):
             path,
             force_refresh,
             arch,
+            effective,
         )
 
-        if arch == "SDXL" and stats:
-            sub_arch = MultiScheduledLoraLoader.classify_sdxl_lineage_from_stats(stats)
-            if sub_arch != "SDXL":
-                arch = sub_arch
+        arch = await loop.run_in_executor(
+            executor,
+            MultiScheduledLoraLoader.refine_sdxl_arch,
+            path,
+            arch,
+            stats,
+            effective,
+        )
 
         response = {"arch": arch}
         if stats:
@@ -333,6 +351,198 @@ async def inspect_lora(request):
         return web.json_response({"arch": "UNKNOWN", "error": str(e)})
 
 
+def _inspect_lora_sync(
+    lora_name: str,
+    path_str: str,
+    force_refresh: bool,
+    with_stats: bool,
+    effective: bool = False,
+):
+    try:
+        path = Path(path_str)
+        arch = MultiScheduledLoraLoader.inspect_lora_architecture(
+            path, force_refresh=force_refresh
+        )
+        response = {"lora_name": lora_name, "arch": arch}
+        if not with_stats:
+            return response
+
+        stats = MultiScheduledLoraLoader.analyze_lora_weights(
+            path, force_refresh, arch, effective
+        )
+        response["arch"] = MultiScheduledLoraLoader.refine_sdxl_arch(
+            path, arch, stats, effective
+        )
+        if stats:
+            response["stats"] = stats
+        return response
+    except Exception as e:
+        return {"lora_name": lora_name, "arch": "UNKNOWN", "error": str(e)}
+
+
+@server.PromptServer.instance.routes.post("/mad-nodes/stats-store/clear")
+async def clear_stats_store(request):
+    """
+    Deletes every row of the persistent weight stats store. Kept apart from
+    clear_cache_all, which only drops in-memory caches.
+    """
+    from .multi_scheduled_lora_loader import _LORA_STATS_STORE
+
+    await asyncio.get_event_loop().run_in_executor(executor, _LORA_STATS_STORE.clear)
+    return web.json_response(
+        {"status": "cleared", "message": "Persistent LoRA stats store cleared."}
+    )
+
+
+@server.PromptServer.instance.routes.post("/mad-nodes/inspect-lora-batch")
+async def inspect_lora_batch(request):
+    """
+    Inspects many LoRAs at once and streams one JSON object per line (NDJSON)
+    as each result completes.
+    """
+    try:
+        data = await request.json()
+    except Exception:
+        data = {}
+
+    if not isinstance(data, dict):
+        return web.json_response(
+            {"status": "error", "message": "Invalid request body"}, status=400
+        )
+
+    names = data.get("lora_names", [])
+    if not isinstance(names, list):
+        return web.json_response(
+            {"status": "error", "message": "Invalid lora_names"}, status=400
+        )
+
+    force_refresh = bool(data.get("refresh", False))
+    with_stats = bool(data.get("stats", True))
+    effective = data.get("energy", "tensor") == "effective"
+
+    unique_names = []
+    seen = set()
+    for name in names:
+        if not isinstance(name, str) or not name or name in seen:
+            continue
+        seen.add(name)
+        unique_names.append(name)
+
+    if len(unique_names) > INSPECT_BATCH_LIMIT:
+        return web.json_response(
+            {
+                "status": "error",
+                "message": f"Too many lora_names ({len(unique_names)}), "
+                f"at most {INSPECT_BATCH_LIMIT} per request",
+            },
+            status=400,
+        )
+
+    loop = asyncio.get_event_loop()
+    paths = await loop.run_in_executor(bulk_executor, LoraOps.resolve_paths, unique_names)
+
+    response = web.StreamResponse(
+        headers={"Content-Type": "application/x-ndjson", "Cache-Control": "no-store"}
+    )
+    await response.prepare(request)
+
+    futures = []
+    try:
+        for name in unique_names:
+            path_str = paths[name]
+            if not path_str:
+                line = {"lora_name": name, "arch": "UNKNOWN", "error": "File not found"}
+                await response.write((json.dumps(line) + "\n").encode("utf-8"))
+                continue
+            futures.append(
+                loop.run_in_executor(
+                    bulk_executor,
+                    _inspect_lora_sync,
+                    name,
+                    path_str,
+                    force_refresh,
+                    with_stats,
+                    effective,
+                )
+            )
+
+        for fut in asyncio.as_completed(futures):
+            line = await fut
+            await response.write((json.dumps(line) + "\n").encode("utf-8"))
+    except (ConnectionResetError, asyncio.CancelledError):
+        for fut in futures:
+            fut.cancel()
+        raise
+
+    await response.write_eof()
+    return response
+
+
+@server.PromptServer.instance.routes.post("/mad-nodes/preanalysis/start")
+async def preanalysis_start(request):
+    """
+    Starts the library-wide LoRA pre-analysis job.
+    """
+    from .multi_scheduled_lora_loader import _PREANALYSIS_JOB
+
+    try:
+        data = await request.json()
+    except Exception:
+        data = {}
+
+    started = _PREANALYSIS_JOB.start(force=bool(data.get("force", False)))
+    if not started:
+        return web.json_response(
+            {"status": "error", "message": "Pre-analysis is already running"},
+            status=409,
+        )
+    return web.json_response({"status": "started", "job": _PREANALYSIS_JOB.status()})
+
+
+@server.PromptServer.instance.routes.post("/mad-nodes/preanalysis/cancel")
+async def preanalysis_cancel(request):
+    from .multi_scheduled_lora_loader import _PREANALYSIS_JOB
+
+    cancelled = _PREANALYSIS_JOB.cancel()
+    return web.json_response(
+        {
+            "status": "cancelling" if cancelled else "idle",
+            "job": _PREANALYSIS_JOB.status(),
+        }
+    )
+
+
+@server.PromptServer.instance.routes.get("/mad-nodes/preanalysis/status")
+async def preanalysis_status(request):
+    from .multi_scheduled_lora_loader import _PREANALYSIS_JOB
+
+    return web.json_response(_PREANALYSIS_JOB.status())
+
+
+if env_flag("PREANALYZE"):
+    from .multi_scheduled_lora_loader import _PREANALYSIS_JOB
+
+    _PREANALYSIS_JOB.start()
+
+
+@server.PromptServer.instance.routes.get("/mad-nodes/cache-stats")
+async def get_cache_stats(request):
+    """
+    Reports hit/miss/eviction counters of the backend LoRA caches.
+    """
+    from .multi_scheduled_lora_loader import _LORA_CACHE, _LORA_TENSOR_CACHE
+
+    return web.json_response(
+        {
+            "info": _LORA_CACHE.stats(),
+            "tensors": _LORA_TENSOR_CACHE.stats(),
+            "headers": HeaderCache.stats(),
+            "sidecars": SidecarCache.stats(),
+            "patched_weights": MadPatcherOverrides.WEIGHT_CACHE.stats(),
+        }
+    )
+
+
 @server.PromptServer.instance.routes.get("/mad-nodes/check-compatibility")
 async def check_compatibility(request):
     """
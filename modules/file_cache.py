@@ -0,0 +1,198 @@
+import os
+import errno
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+def file_signature(file_path) -> Optional[Tuple[str, int, int]]:
+    """Returns (absolute path, size, mtime_ns), or None if the file is gone."""
+    try:
+        path_str = os.path.abspath(str(file_path))
+        st = os.stat(path_str)
+    except (OSError, TypeError, ValueError):
+        return None
+    return path_str, st.st_size, st.st_mtime_ns
+
+
+class ValidatedLRU:
+    """
+    Thread-safe LRU of values derived from files.
+
+    Entries are keyed by (absolute path, variant) and remember the file's
+    (size, mtime_ns) when they were stored. Once the file changes or
+    disappears, every variant of it is dropped on the next access. The cache
+    is bounded by entry count (`max_entries`) and, when `max_bytes` is set,
+    by the `nbytes` passed to `put`; 0 leaves a bound off.
+
+    Subclasses extend eviction through `_over_budget_locked` and
+    `_evict_oldest_locked`.
+    """
+
+    def __init__(self, max_entries: int = 0, max_bytes: int = 0):
+        self.max_entries = max(0, int(max_entries))
+        self.max_bytes = max(0, int(max_bytes))
+        self._entries: "OrderedDict[Tuple[str, Hashable], Tuple[Tuple[int, int], Any, int]]" = (
+            OrderedDict()
+        )
+        self._variants: Dict[str, set] = {}
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, file_path, variant: Hashable = None) -> Any:
+        """Cached value, or None if there is none or the file changed."""
+        sig = file_signature(file_path)
+        with self._lock:
+            value = self._lookup_locked(file_path, sig, variant)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def put(
+        self,
+        file_path,
+        value: Any,
+        variant: Hashable = None,
+        nbytes: int = 0,
+        sig: Optional[Tuple[str, int, int]] = None,
+    ) -> bool:
+        """
+        Stores `value` under the file's current signature, or under `sig` when
+        it was taken before the value was computed. Returns False if the value
+        was not stored (file gone, or over the budget).
+        """
+        if sig is None:
+            sig = file_signature(file_path)
+        if sig is None or (self.max_bytes and nbytes > self.max_bytes):
+            return False
+        with self._lock:
+            return self._store_locked(sig, variant, value, nbytes)
+
+    def get_or_load(
+        self, file_path, loader: Callable[[str], Any], variant: Hashable = None
+    ) -> Any:
+        """
+        Cached value, or `loader(absolute path)` stored under the signature
+        taken before it ran. Raises FileNotFoundError if the file is gone.
+        Exceptions from `loader` propagate, and neither they nor a None
+        result are cached.
+        """
+        sig = file_signature(file_path)
+        if sig is None:
+            self.invalidate(file_path)
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), str(file_path))
+        with self._lock:
+            value = self._lookup_locked(file_path, sig, variant)
+            if value is not None:
+                self.hits += 1
+                return value
+            self.misses += 1
+        value = loader(sig[0])
+        if value is not None:
+            self.put(file_path, value, variant, sig=sig)
+        return value
+
+    def invalidate(self, file_path=None) -> None:
+        """Drops every variant of one file, or everything."""
+        with self._lock:
+            if file_path is None:
+                for path_str in list(self._variants):
+                    self._drop_path_locked(path_str)
+                return
+            self._discard_path_locked(os.path.abspath(str(file_path)))
+
+    def clear(self) -> None:
+        self.invalidate()
+
+    def on_files_changed(self, changes: Dict[str, str]) -> None:
+        """LoraWatcher listener: drops entries of changed files."""
+        for path in changes:
+            self.invalidate(path)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {"entries": len(self._entries)}
+            if self.max_entries:
+                stats["max_entries"] = self.max_entries
+            if self.max_bytes:
+                stats["bytes"] = self._bytes
+                stats["max_bytes"] = self.max_bytes
+            stats.update(
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                invalidations=self.invalidations,
+            )
+            return stats
+
+    def _lookup_locked(self, file_path, sig, variant: Hashable) -> Any:
+        """Value of a valid entry, moved to the most recent end; else None."""
+        if sig is None:
+            self._discard_path_locked(os.path.abspath(str(file_path)))
+            return None
+        path_str, size, mtime_ns = sig
+        key = (path_str, variant)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] != (size, mtime_ns):
+            self._discard_path_locked(path_str)
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def _store_locked(self, sig, variant: Hashable, value: Any, nbytes: int) -> bool:
+        path_str, size, mtime_ns = sig
+        for other in list(self._variants.get(path_str, ())):
+            if self._entries[(path_str, other)][0] != (size, mtime_ns):
+                self._discard_path_locked(path_str)
+                break
+        key = (path_str, variant)
+        if key in self._entries:
+            self._drop_locked(key)
+        while self._entries and self._over_budget_locked(nbytes):
+            self._evict_oldest_locked()
+        if self._over_budget_locked(nbytes):
+            return False
+        self._entries[key] = ((size, mtime_ns), value, nbytes)
+        self._variants.setdefault(path_str, set()).add(variant)
+        self._bytes += nbytes
+        return True
+
+    def _over_budget_locked(self, nbytes: int) -> bool:
+        """True if an entry of `nbytes` can't be added without evicting."""
+        if self.max_entries and len(self._entries) >= self.max_entries:
+            return True
+        return bool(self.max_bytes) and self._bytes + nbytes > self.max_bytes
+
+    def _evict_oldest_locked(self) -> None:
+        self._drop_locked(next(iter(self._entries)))
+        self.evictions += 1
+
+    def _discard_path_locked(self, path_str: str) -> None:
+        """Drops a changed, missing or invalidated file."""
+        if path_str in self._variants:
+            self._drop_path_locked(path_str)
+            self.invalidations += 1
+
+    def _drop_path_locked(self, path_str: str) -> None:
+        for variant in list(self._variants.get(path_str, ())):
+            self._drop_locked((path_str, variant))
+
+    def _drop_locked(self, key: Tuple[str, Hashable]) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry[2]
+        variants = self._variants.get(key[0])
+        if variants is not None:
+            variants.discard(key[1])
+            if not variants:
+                del self._variants[key[0]]
@@ -0,0 +1,367 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import torch
+import comfy.utils
+import comfy.model_management
+
+from .file_cache import ValidatedLRU, file_signature
+from .safetensors_io import LazyStateDict
+from .settings import env_flag, env_int, env_str
+
+LOG_PREFIX = "[MAD-NODES-CACHE]"
+
+MB = 1024 * 1024
+
+
+def state_dict_nbytes(
+    sd: Dict[str, Any], shared_with: Optional[Dict[str, Any]] = None
+) -> int:
+    """
+    Bytes held by the dict's tensors, skipping tensors shared with `shared_with`.
+    A LazyStateDict counts its mapped size: its pages are file-backed, but
+    each one keeps a mapping (and a file descriptor) open until evicted.
+    """
+    if isinstance(sd, LazyStateDict):
+        return sd.nbytes
+    total = 0
+    for k, t in sd.items():
+        if not isinstance(t, torch.Tensor):
+            continue
+        if shared_with is not None and shared_with.get(k) is t:
+            continue
+        total += t.numel() * t.element_size()
+    return total
+
+
+class LoraTensorCache(ValidatedLRU):
+    """
+    Process-wide LRU of loaded LoRA state dicts and tensors derived from them.
+    Entries are keyed by (absolute path, variant) and validated against the file's
+    (size, mtime_ns); a mismatch drops every variant of that file.
+    The byte budget is enforced on insert. When `min_free_bytes` is set,
+    `trim` also evicts entries while available system RAM is below it.
+    Cached dicts are shared between callers and must be treated as read-only.
+    With `lazy`, .safetensors files are opened as a LazyStateDict instead of
+    being read into memory; it is closed once its file leaves the cache.
+    """
+
+    RAW = ""
+
+    def __init__(self, max_bytes: int, min_free_bytes: int = 0, lazy: bool = False):
+        super().__init__(max_bytes=max_bytes)
+        self.min_free_bytes = max(0, int(min_free_bytes))
+        self.lazy = lazy
+
+    @classmethod
+    def from_env(cls) -> "LoraTensorCache":
+        return cls(
+            max_bytes=env_int("LORA_CACHE_MB", 2048) * MB,
+            min_free_bytes=env_int("LORA_CACHE_MIN_FREE_MB", 0) * MB,
+            lazy=env_flag("LAZY_LOAD", True),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, file_path, variant: str = RAW) -> Optional[Dict[str, Any]]:
+        return super().get(file_path, variant)
+
+    def put(
+        self,
+        file_path,
+        sd: Dict[str, Any],
+        variant: str = RAW,
+        base: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """
+        Stores `sd` for the file. When `sd` was derived from `base` and `base`
+        is the cached raw dict of the same file, tensors shared by reference
+        with it are not counted against the budget.
+        """
+        if not self.enabled or not sd:
+            return
+        sig = file_signature(file_path)
+        if sig is None:
+            return
+        with self._lock:
+            if base is not None:
+                raw = self._entries.get((sig[0], self.RAW))
+                if raw is None or raw[0] != sig[1:] or raw[1] is not base:
+                    base = None
+            nbytes = state_dict_nbytes(sd, shared_with=base)
+            if nbytes <= self.max_bytes:
+                self._store_locked(sig, variant, sd, nbytes)
+
+    def load(self, file_path) -> Optional[Dict[str, Any]]:
+        """Returns the cached state dict for the file, loading it on a miss."""
+        sd = self.get(file_path)
+        if sd is not None:
+            return sd
+        sd = None
+        if self.lazy and str(file_path).lower().endswith(".safetensors"):
+            try:
+                sd = LazyStateDict(file_path)
+            except (OSError, ValueError) as e:
+                logging.warning(f"{LOG_PREFIX} Lazy load failed, reading {file_path}: {e}")
+        if sd is None:
+            sd = comfy.utils.load_torch_file(str(file_path), safe_load=True)
+        if sd:
+            self.put(file_path, sd)
+        return sd
+
+    def trim(self) -> None:
+        """Evicts entries while available system RAM is below `min_free_bytes`."""
+        with self._lock:
+            while self._entries and self._low_on_memory():
+                self._evict_oldest_locked()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "files": len(self._variants),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _evict_oldest_locked(self) -> None:
+        key = next(iter(self._entries))
+        if key[1] == self.RAW:
+            # Derived variants may share tensors with the raw dict and were
+            # sized without them, so they go together.
+            self.evictions += len(self._variants.get(key[0], ()))
+            self._drop_path_locked(key[0])
+        else:
+            self._drop_locked(key)
+            self.evictions += 1
+
+    def _drop_path_locked(self, path_str: str) -> None:
+        raw = self._entries.get((path_str, self.RAW))
+        super()._drop_path_locked(path_str)
+        # No cached variant can reference the mapping any more.
+        if raw is not None and isinstance(raw[1], LazyStateDict):
+            raw[1].close()
+
+    def _low_on_memory(self) -> bool:
+        if self.min_free_bytes <= 0:
+            return False
+        try:
+            free = comfy.model_management.get_free_memory(torch.device("cpu"))
+        except Exception:
+            return False
+        return free < self.min_free_bytes
+
+
+class PatchedWeightCache:
+    """
+    Process-wide LRU of hook-patched weights, kept in CPU memory (pinned when
+    CUDA is available) so later sampling runs and model clones with the same
+    LoRA stack and strengths copy them back instead of recomputing them.
+    Keys are built by the caller and must identify the base weight and every
+    patch applied to it (see MadPatcherOverrides._weight_cache_key); their
+    first element is the owning model's token, used by `discard_owner`.
+
+    With the "lru" policy the least recently used entries make room for new
+    ones. With "retain", entries are kept until invalidated and new ones are
+    skipped once the budget is full, which keeps part of a stack that is
+    larger than the budget cached instead of cycling through it.
+    Disabled when `max_bytes` is 0.
+
+    Copies from the GPU into pinned memory are queued without waiting on the
+    current stream, so patching never stalls on them; `get` waits for an
+    entry's copy only if it is still in flight. Pinned blocks of evicted
+    entries go back to PyTorch's caching host allocator and serve later
+    copies.
+    """
+
+    POLICIES = ("lru", "retain")
+
+    def __init__(self, max_bytes: int, pin: bool = True, policy: str = "lru"):
+        self.max_bytes = max(0, int(max_bytes))
+        self.pin = pin
+        if policy not in self.POLICIES:
+            logging.warning(f"{LOG_PREFIX} Unknown patch cache policy {policy!r}, using lru")
+            policy = "lru"
+        self.policy = policy
+        self._entries: "OrderedDict[tuple, torch.Tensor]" = OrderedDict()
+        self._copies: Dict[tuple, Any] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls) -> "PatchedWeightCache":
+        return cls(
+            max_bytes=env_int("PATCH_CACHE_MB", 0) * MB,
+            pin=env_flag("PATCH_CACHE_PIN", True),
+            policy=env_str("PATCH_CACHE_POLICY", "lru").lower(),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, key: tuple) -> Optional[torch.Tensor]:
+        with self._lock:
+            tensor = self._entries.get(key)
+            if tensor is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            copied = self._copies.get(key)
+        if copied is not None:
+            copied.synchronize()
+            with self._lock:
+                self._copies.pop(key, None)
+        return tensor
+
+    def __contains__(self, key: tuple) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def put(self, key: tuple, tensor: torch.Tensor) -> None:
+        """Stores a CPU copy of `tensor`; skipped when it doesn't fit the budget."""
+        nbytes = tensor.numel() * tensor.element_size()
+        if not self.enabled or nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            if self.policy == "retain" and self._bytes + nbytes > self.max_bytes:
+                return
+            while self._entries and self._bytes + nbytes > self.max_bytes:
+                self._pop_locked(next(iter(self._entries)))
+                self.evictions += 1
+
+        pin = self.pin and tensor.device.type == "cuda"
+        copy = torch.empty(tensor.shape, dtype=tensor.dtype, device="cpu", pin_memory=pin)
+        copied = None
+        if pin:
+            # Ordered after the kernels that wrote `tensor` and before any
+            # later reuse of its memory on the same stream.
+            copy.copy_(tensor, non_blocking=True)
+            copied = torch.cuda.Event()
+            copied.record(torch.cuda.current_stream(tensor.device))
+        else:
+            copy.copy_(tensor)
+
+        with self._lock:
+            if key in self._entries or self._bytes + nbytes > self.max_bytes:
+                return
+            self._entries[key] = copy
+            if copied is not None:
+                self._copies[key] = copied
+            self._bytes += nbytes
+
+    def discard_owner(self, owner) -> None:
+        """Drops every entry of one model (key[0] == owner)."""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == owner]:
+                self._pop_locked(key)
+
+    def invalidate(self, key=None) -> None:
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self._copies.clear()
+                self._bytes = 0
+                return
+            if key in self._entries:
+                self._pop_locked(key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "policy": self.policy,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _pop_locked(self, key: tuple) -> None:
+        tensor = self._entries.pop(key)
+        self._copies.pop(key, None)
+        self._bytes -= tensor.numel() * tensor.element_size()
+
+
+class LoraInfoCache(ValidatedLRU):
+    """
+    Bounded, thread-safe LRU of per-file analysis results (arch, stats, ...).
+    Each entry remembers the file's (size, mtime_ns) and is dropped when the
+    file changes or disappears, so replaced LoRAs never serve stale results.
+    """
+
+    def __init__(self, max_entries: int):
+        super().__init__(max_entries=max(1, int(max_entries)))
+
+    @classmethod
+    def from_env(cls) -> "LoraInfoCache":
+        return cls(max_entries=env_int("INFO_CACHE_ENTRIES", 4096))
+
+    def get(self, file_path, field: str) -> Any:
+        sig = file_signature(file_path)
+        with self._lock:
+            fields = self._lookup_locked(file_path, sig, None)
+            value = fields.get(field) if fields is not None else None
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return value
+
+    def set(self, file_path, field: str, value: Any) -> None:
+        sig = file_signature(file_path)
+        if sig is None:
+            return
+        with self._lock:
+            fields = self._lookup_locked(file_path, sig, None)
+            if fields is None:
+                fields = {}
+                self._store_locked(sig, None, fields, 0)
+            fields[field] = value
+
+
+def install_unload_hook(cache: LoraTensorCache) -> None:
+    """
+    Drops cached tensors whenever ComfyUI unloads all models
+    (e.g. the "Free model and node cache" action), so our cache
+    follows the same memory-management signal as the model cache.
+    """
+    mm = comfy.model_management
+    original = getattr(mm, "unload_all_models", None)
+    if original is None:
+        return
+
+    hooked = getattr(original, "_mad_nodes_caches", None)
+    if hooked is not None:
+        if cache not in hooked:
+            hooked.append(cache)
+        return
+
+    caches = [cache]
+
+    def unload_all_models(*args, **kwargs):
+        for c in caches:
+            try:
+                c.invalidate()
+            except Exception as e:
+                logging.warning(f"{LOG_PREFIX} Failed to clear tensor cache: {e}")
+        return original(*args, **kwargs)
+
+    unload_all_models._mad_nodes_caches = caches
+    unload_all_models.__wrapped__ = original
+    mm.unload_all_models = unload_all_models
@@ -1,10 +1,11 @@
-import json
-import struct
 import logging
 import re
 from pathlib import Path
 from typing import Optional, Dict, Any
 
+from .safetensors_io import HeaderCache
+from .sidecar_cache import SidecarCache
+
 LOG_PREFIX = "[MAD-NODES-INSPECTOR]"
 
 
@@ -78,71 +79,39 @@ class LoRAInspector:
 
     @classmethod
     def _check_metadata(cls, path: Path) -> Optional[str]:
-        candidates = [
-            path.with_name(f"{path.stem}.metadata.json"),
-            path.with_name(f"{path.stem}.json"),
-        ]
-        for json_path in candidates:
-            if not json_path.exists():
-                continue
-            try:
-                with open(json_path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-
-                civitai = data.get("civitai", {})
-
-                tags = civitai.get("tags", [])
-                if isinstance(tags, list):
-                    for tag in tags:
-                        res = cls._map_str(str(tag))
-                        if res and res != "SDXL":
-                            return res
-
-                sources = [
-                    data.get("baseModel"),
-                    data.get("base_model"),
-                    data.get("sd_version"),
-                    data.get("modelspec.architecture"),
-                    civitai.get("baseModel"),
-                ]
-
-                generic_match = None
-                for val in sources:
-                    if val:
-                        res = cls._map_str(str(val))
-                        if res:
-                            if res != "SDXL":
-                                return res
-                            generic_match = res
-
-                if generic_match:
-                    return generic_match
-
-            except (OSError, json.JSONDecodeError):
-                continue
+        for fields in SidecarCache.for_lora(path):
+            for tag in fields["tags"]:
+                res = cls._map_str(tag)
+                if res and res != "SDXL":
+                    return res
+
+            generic_match = None
+            for val in fields["base_models"]:
+                res = cls._map_str(val)
+                if res:
+                    if res != "SDXL":
+                        return res
+                    generic_match = res
+
+            if generic_match:
+                return generic_match
         return None
 
     @classmethod
     def _analyze_header(cls, path: Path) -> str:
         try:
-            with open(path, "rb") as f:
-                header_len_bytes = f.read(8)
-                if len(header_len_bytes) != 8:
-                    return "UNKNOWN"
-                header_len = struct.unpack("<Q", header_len_bytes)[0]
-                header_bytes = f.read(header_len)
-                header = json.loads(header_bytes)
-
-            meta = header.get("__metadata__", {})
+            header = HeaderCache.get(path)
+
+            meta = header.metadata
             if "ss_base_model_version" in meta:
                 res = cls._map_str(meta["ss_base_model_version"])
                 if res:
                     return res
 
-            keys = [k for k in header.keys() if k != "__metadata__"]
-
-            def has(sub):
-                return any(sub in k for k in keys)
+            # All keys in one string: each check below is a single C-level
+            # substring search instead of a Python loop over the keys.
+            # No signature contains "\n", so matches can't span two keys.
+            has = "\n".join(header.keys).__contains__
 
             if has("double_blocks") or has("img_in"):
                 return "FLUX.1"
@@ -163,11 +132,8 @@ class LoRAInspector:
             if has("h.0"):
                 return "HYVID"
 
-            for k, v in header.items():
-                if k == "__metadata__":
-                    continue
+            for k, (_, shape, _, _) in header.tensors.items():
                 if ("to_k" in k or "linear" in k) and "down" in k:
-                    shape = v.get("shape", [])
                     if shape:
                         dim = shape[-1]
                         if dim == 320:
@@ -177,7 +143,7 @@ class LoRAInspector:
                         if dim == 640:
                             return "SDXL"
 
-        except (OSError, struct.error, json.JSONDecodeError) as e:
+        except (OSError, ValueError) as e:
             logging.warning(f"{LOG_PREFIX} Header analysis failed for {path.name}: {e}")
 
         return "UNKNOWN"
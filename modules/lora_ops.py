@@ -1,6 +1,11 @@
 import re
+import copy
 import json
+import math
+import functools
+import itertools
 import logging
+import weakref
 import torch
 import comfy.utils
 import folder_paths
@@ -16,6 +21,15 @@ except ImportError:
 from pathlib import Path
 from typing import List, Dict, Any, Optional, Tuple
 
+from .lora_cache import PatchedWeightCache
+from .name_index import NameIndex
+from .settings import env_flag, env_float, env_int
+from .sidecar_cache import SidecarCache
+from .safetensors_io import HAS_NUMPY, HeaderCache, tensor_norms
+
+if HAS_NUMPY:
+    import numpy as np
+
 
 try:
     from safetensors import safe_open
@@ -203,15 +217,9 @@ class BlockMapper:
                     return gid
         return "aux"
 
-    @staticmethod
-    def get_info(key: str, arch: str, total_layers: int = 0) -> Tuple[str, str]:
-        """
-        Returns (standardized_block_name, semantic_tag)
-        """
-        k = key.lower()
-
-        if any(
-            x in k
+    _CLIP_RE = re.compile(
+        "|".join(
+            re.escape(x)
             for x in [
                 "te_",
                 "text_model",
@@ -223,13 +231,11 @@ class BlockMapper:
                 "txt_proj",
                 "logit_scale",
             ]
-        ):
-            m = re.search(r"layers?[\._](\d+)", k)
-            name = f"clip_layer_{m.group(1)}" if m else "clip_encoder"
-            return name, "CLIP"
-
-        if any(
-            x in k
+        )
+    )
+    _EMBED_RE = re.compile(
+        "|".join(
+            re.escape(x)
             for x in [
                 "time_embed",
                 "label_embed",
@@ -240,71 +246,113 @@ class BlockMapper:
                 "norm_out",
                 "proj_out",
             ]
-        ):
-            return "specialized_embeds", "OTHER"
+        )
+    )
+    _CLIP_LAYER_RE = re.compile(r"layers?[\._](\d+)")
+    _LAYER_RE = re.compile(r"(?:layers|blocks|h)[\._](\d+)")
+    _INPUT_RE = re.compile(r"input_blocks[\._](\d+)")
+    _OUTPUT_RE = re.compile(r"output_blocks[\._](\d+)")
+    _DOUBLE_RE = re.compile(r"double_blocks[\._](\d+)")
+    _SINGLE_RE = re.compile(r"single_blocks[\._](\d+)")
+    _JOINT_RE = re.compile(r"joint_blocks[\._](\d+)")
 
-        if "SDXL" in arch or arch == "UNKNOWN":
-            if "input_block" in k:
-                m = re.search(r"input_blocks[\._](\d+)", k)
-                idx = int(m.group(1)) if m else 0
-                return f"input_{idx}", "POSE"
-
-            if "middle_block" in k:
-                return "middle_0", "IDENTITY"
-
-            if "output_block" in k:
-                m = re.search(r"output_blocks[\._](\d+)", k)
-                idx = int(m.group(1)) if m else 0
-                if idx <= 2:
-                    tag = "IDENTITY"
-                elif idx <= 5:
-                    tag = "STYLE"
-                else:
-                    tag = "DETAILS"
-                return f"output_{idx}", tag
+    @staticmethod
+    def _sdxl_output_tag(idx: int) -> str:
+        if idx <= 2:
+            return "IDENTITY"
+        if idx <= 5:
+            return "STYLE"
+        return "DETAILS"
 
-        if "FLUX" in arch:
-            if "double_block" in k:
-                m = re.search(r"double_blocks[\._](\d+)", k)
-                idx = int(m.group(1)) if m else 0
-                tag = "POSE" if idx <= 10 else "IDENTITY"
-                return f"double_{idx}", tag
-
-            if "single_block" in k:
-                m = re.search(r"single_blocks[\._](\d+)", k)
-                idx = int(m.group(1)) if m else 0
-                tag = "STYLE" if idx <= 20 else "DETAILS"
-                return f"single_{idx}", tag
+    @staticmethod
+    def _flux_double_tag(idx: int) -> str:
+        return "POSE" if idx <= 10 else "IDENTITY"
 
-        if "SD1" in arch or "SD2" in arch:
-            if "input_block" in k:
-                m = re.search(r"input_blocks[\._](\d+)", k)
-                idx = int(m.group(1)) if m else 0
-                tag = "POSE" if idx <= 8 else "IDENTITY"
-                return f"input_{idx}", tag
-            if "middle_block" in k:
-                return "middle_0", "IDENTITY"
-            if "output_block" in k:
-                m = re.search(r"output_blocks[\._](\d+)", k)
-                idx = int(m.group(1)) if m else 0
-                tag = "IDENTITY" if idx <= 2 else ("STYLE" if idx <= 8 else "DETAILS")
-                return f"output_{idx}", tag
+    @staticmethod
+    def _flux_single_tag(idx: int) -> str:
+        return "STYLE" if idx <= 20 else "DETAILS"
 
+    @staticmethod
+    def _sd_input_tag(idx: int) -> str:
+        return "POSE" if idx <= 8 else "IDENTITY"
+
+    @staticmethod
+    def _sd_output_tag(idx: int) -> str:
+        return "IDENTITY" if idx <= 2 else ("STYLE" if idx <= 8 else "DETAILS")
+
+    @staticmethod
+    def _sd3_joint_tag(idx: int) -> str:
+        if idx < 6:
+            return "POSE"
+        if idx < 12:
+            return "IDENTITY"
+        if idx < 18:
+            return "STYLE"
+        return "DETAILS"
+
+    @classmethod
+    @functools.lru_cache(maxsize=64)
+    def _arch_rules(cls, arch: str) -> Tuple[Tuple[Any, ...], ...]:
+        """
+        Ordered (substring, index regex, block prefix, tag) rules for an
+        architecture. `tag` is either a fixed tag or a function of the index;
+        a rule without an index regex maps to the fixed block `prefix`.
+        Rules are checked in the same order as the architecture branches.
+        """
+        rules = []
+        if "SDXL" in arch or arch == "UNKNOWN":
+            rules += [
+                ("input_block", cls._INPUT_RE, "input", "POSE"),
+                ("middle_block", None, "middle_0", "IDENTITY"),
+                ("output_block", cls._OUTPUT_RE, "output", cls._sdxl_output_tag),
+            ]
+        if "FLUX" in arch:
+            rules += [
+                ("double_block", cls._DOUBLE_RE, "double", cls._flux_double_tag),
+                ("single_block", cls._SINGLE_RE, "single", cls._flux_single_tag),
+            ]
+        if "SD1" in arch or "SD2" in arch:
+            rules += [
+                ("input_block", cls._INPUT_RE, "input", cls._sd_input_tag),
+                ("middle_block", None, "middle_0", "IDENTITY"),
+                ("output_block", cls._OUTPUT_RE, "output", cls._sd_output_tag),
+            ]
         if "SD3" in arch:
-            if "joint_block" in k:
-                m = re.search(r"joint_blocks[\._](\d+)", k)
-                idx = int(m.group(1)) if m else 0
-                if idx < 6:
-                    tag = "POSE"
-                elif idx < 12:
-                    tag = "IDENTITY"
-                elif idx < 18:
-                    tag = "STYLE"
-                else:
-                    tag = "DETAILS"
-                return f"joint_{idx}", tag
+            rules.append(("joint_block", cls._JOINT_RE, "joint", cls._sd3_joint_tag))
+        return tuple(rules)
 
-        m = re.search(r"(?:layers|blocks|h)[\._](\d+)", k)
+    @staticmethod
+    def get_info(key: str, arch: str, total_layers: int = 0) -> Tuple[str, str]:
+        """
+        Returns (standardized_block_name, semantic_tag)
+        Results are memoized per (key, arch, total_layers), since the same
+        key names repeat across files and calls.
+        """
+        return BlockMapper._classify(key, arch, total_layers)
+
+    @classmethod
+    @functools.lru_cache(maxsize=65536)
+    def _classify(cls, key: str, arch: str, total_layers: int) -> Tuple[str, str]:
+        k = key.lower()
+
+        if cls._CLIP_RE.search(k):
+            m = cls._CLIP_LAYER_RE.search(k)
+            name = f"clip_layer_{m.group(1)}" if m else "clip_encoder"
+            return name, "CLIP"
+
+        if cls._EMBED_RE.search(k):
+            return "specialized_embeds", "OTHER"
+
+        for needle, index_re, prefix, tag in cls._arch_rules(arch):
+            if needle not in k:
+                continue
+            if index_re is None:
+                return prefix, tag
+            m = index_re.search(k)
+            idx = int(m.group(1)) if m else 0
+            return f"{prefix}_{idx}", tag(idx) if callable(tag) else tag
+
+        m = cls._LAYER_RE.search(k)
         if m:
             idx = int(m.group(1))
             name = f"layers_{idx}"
@@ -323,6 +371,52 @@ class BlockMapper:
         return "misc", "OTHER"
 
 
+class KeyLayout:
+    """
+    Block assignment of every tensor key in one LoRA file for one architecture.
+    Built once per file and shared by the stats, preset and block-weighting
+    paths, so key names are only parsed once.
+    """
+
+    _LAYER_RE = re.compile(r"(?:layers|blocks|h)[\._](\d+)")
+
+    def __init__(self, arch: str, total_layers: int, blocks: Dict[str, Tuple[str, str]]):
+        self.arch = arch
+        self.total_layers = total_layers
+        self.blocks = blocks
+        self.block_tags: Dict[str, str] = {}
+        for block_id, tag in blocks.values():
+            self.block_tags.setdefault(block_id, tag)
+        self.groups = {b: BlockMapper.get_group(b) for b in self.block_tags}
+
+    @classmethod
+    def count_layers(cls, keys) -> int:
+        max_layer_idx = 0
+        for k in keys:
+            m = cls._LAYER_RE.search(k)
+            if m:
+                max_layer_idx = max(max_layer_idx, int(m.group(1)))
+        return max_layer_idx + 1
+
+    @classmethod
+    def from_keys(cls, keys, arch: str) -> "KeyLayout":
+        keys = list(keys)
+        total_layers = cls.count_layers(keys)
+        blocks = {k: BlockMapper.get_info(k, arch, total_layers) for k in keys}
+        return cls(arch, total_layers, blocks)
+
+    def info(self, key: str) -> Tuple[str, str]:
+        """(block_id, tag) of a key; keys outside the layout are classified on the fly."""
+        info = self.blocks.get(key)
+        if info is None:
+            info = BlockMapper.get_info(key, self.arch, self.total_layers)
+        return info
+
+    def group(self, block_id: str) -> str:
+        group = self.groups.get(block_id)
+        return group if group is not None else BlockMapper.get_group(block_id)
+
+
 class AnalysisMath:
     @staticmethod
     def calculate_gini(values: List[float]) -> float:
@@ -337,24 +431,35 @@ class AnalysisMath:
             n_tensor * arr_tensor.sum()
         )
 
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def block_sort_key(block_id: str) -> Tuple[int, int]:
+        """(position of the block family in BLOCK_ORDER, first index in the id)."""
+        prefix = block_id.split("_")[0].lower()
+        nums = re.findall(r"\d+", block_id)
+        idx = int(nums[0]) if nums else 0
+        try:
+            rank = UI_CONFIG["BLOCK_ORDER"].index(prefix)
+        except ValueError:
+            rank = 99
+        return (rank, idx)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def block_order(block_ids: Tuple[str, ...]) -> Tuple[str, ...]:
+        """
+        Returns block_ids in depth order.
+        Each architecture has a small, fixed block vocabulary, so this is
+        computed once per block set. Ties keep the given order.
+        """
+        return tuple(sorted(block_ids, key=AnalysisMath.block_sort_key))
+
     @staticmethod
     def calculate_bias(block_data: Dict[str, float]) -> float:
         if not block_data:
             return 0.0
 
-        order_list = UI_CONFIG["BLOCK_ORDER"]
-
-        def sort_key(k):
-            prefix = k.split("_")[0].lower()
-            nums = re.findall(r"\d+", k)
-            idx = int(nums[0]) if nums else 0
-            try:
-                rank = order_list.index(prefix)
-            except ValueError:
-                rank = 99
-            return (rank, idx)
-
-        sorted_keys = sorted(block_data.keys(), key=sort_key)
+        sorted_keys = sorted(block_data.keys(), key=AnalysisMath.block_sort_key)
         total_energy = sum(block_data.values())
         if total_energy == 0:
             return 0.0
@@ -372,6 +477,78 @@ class AnalysisMath:
 
         return weighted_sum / total_energy
 
+    @staticmethod
+    def batch_metrics(energy_maps: List[Dict[str, float]]) -> List[Dict[str, Any]]:
+        """
+        Sparsity (Gini) and balance for many LoRAs.
+
+        The per-block energies are stacked into an N x B matrix over the union
+        of block ids, with a mask for blocks a LoRA does not have; every metric
+        then runs as a handful of NumPy ops over the whole batch. Results
+        match calculate_gini / calculate_bias on each row, except that an
+        all-zero row has a sparsity of 0.0.
+        """
+        if not energy_maps:
+            return []
+        if not HAS_NUMPY:
+            return [AnalysisMath._scalar_metrics(m) for m in energy_maps]
+
+        columns = {}
+        for energies in energy_maps:
+            for block_id in energies:
+                columns.setdefault(block_id, None)
+        ordered = AnalysisMath.block_order(tuple(columns))
+        col = {b: i for i, b in enumerate(ordered)}
+
+        n_rows, n_cols = len(energy_maps), len(ordered)
+        energy = np.zeros((n_rows, n_cols), dtype=np.float64)
+        present = np.zeros((n_rows, n_cols), dtype=bool)
+        for r, energies in enumerate(energy_maps):
+            if not energies:
+                continue
+            idx = [col[b] for b in energies]
+            energy[r, idx] = list(energies.values())
+            present[r, idx] = True
+
+        counts = present.sum(axis=1)
+        totals = energy.sum(axis=1)
+        safe_totals = np.where(totals == 0, 1.0, totals)
+
+        # Gini over each row's own blocks: absent entries sort last as +inf
+        # and are then zeroed, so they carry no weight.
+        values = np.where(present, np.abs(energy), np.inf)
+        values.sort(axis=1)
+        values[np.isinf(values)] = 0.0
+        rank = np.arange(1, n_cols + 1, dtype=np.float64)
+        weights = 2 * rank[None, :] - counts[:, None] - 1
+        abs_totals = values.sum(axis=1)
+        gini = (weights * values).sum(axis=1) / np.where(
+            abs_totals == 0, 1.0, counts * abs_totals
+        )
+        gini[(counts < 2) | (abs_totals == 0)] = 0.0
+
+        # Balance: each present block's position among that row's blocks,
+        # mapped to [-1, 1] along the depth order.
+        position = np.cumsum(present, axis=1) - 1
+        span = np.where(counts > 1, counts - 1, 1)[:, None]
+        bipolar = np.where(present, position / span * 2 - 1.0, 0.0)
+        balance = (energy * bipolar).sum(axis=1) / safe_totals
+        balance[(counts <= 1) | (totals == 0)] = 0.0
+
+        return [
+            {"sparsity": float(gini[r]), "balance": float(balance[r])}
+            for r in range(n_rows)
+        ]
+
+    @staticmethod
+    def _scalar_metrics(energies: Dict[str, float]) -> Dict[str, Any]:
+        total = sum(energies.values())
+        sparsity = float(AnalysisMath.calculate_gini(list(energies.values())))
+        return {
+            "sparsity": sparsity if total else 0.0,
+            "balance": float(AnalysisMath.calculate_bias(energies)),
+        }
+
 
 class LoraOps:
     @staticmethod
@@ -390,30 +567,22 @@ class LoraOps:
         direct = folder_paths.get_full_path("loras", lora_name)
         if direct:
             return direct
-        try:
-            available = folder_paths.get_filename_list("loras")
-        except Exception:
-            available = []
-        target_stem = Path(lora_name).stem.lower()
-        target_base = Path(lora_name).name.lower()
-        best, best_score = None, -1
-        for rel in available:
-            p = Path(rel)
-            score = -1
-            if p.name.lower() == target_base:
-                score = 100
-            elif p.stem.lower() == target_stem:
-                score = 50
-            if score > -1:
-                provided_norm = str(Path(lora_name)).replace("\\", "/").lower()
-                rel_norm = str(p).replace("\\", "/").lower()
-                if "/" in provided_norm and provided_norm in rel_norm:
-                    score += 25
-                if score > best_score:
-                    best_score = score
-                    best = rel
+        best = NameIndex.find("loras", lora_name)
         return folder_paths.get_full_path("loras", best) if best else None
 
+    @staticmethod
+    def resolve_paths(lora_names: List[str]) -> Dict[str, Optional[str]]:
+        """`resolve_path` for many names against one snapshot of the name index."""
+        index = NameIndex.get("loras")
+        paths = {}
+        for name in lora_names:
+            path = folder_paths.get_full_path("loras", name) if name else None
+            if not path and name:
+                best = index.find(name)
+                path = folder_paths.get_full_path("loras", best) if best else None
+            paths[name] = path
+        return paths
+
     @staticmethod
     def resolve_model_path(model_name: str) -> Optional[str]:
         if not model_name:
@@ -427,115 +596,157 @@ class LoraOps:
         if raw_path and raw_path.exists():
             return str(raw_path.resolve())
 
-        for category in ["checkpoints", "diffusion_models"]:
+        for category in NameIndex.MODEL_CATEGORIES:
             direct = folder_paths.get_full_path(category, model_name)
             if direct:
                 return direct
 
-        target_stem = Path(model_name).stem.lower()
-        target_base = Path(model_name).name.lower()
-        target_has_ext = Path(model_name).suffix != ""
-        provided_norm = str(Path(model_name)).replace("\\", "/").lower()
+        for category in NameIndex.MODEL_CATEGORIES:
+            rel = NameIndex.find_model(category, model_name)
+            resolved = folder_paths.get_full_path(category, rel) if rel else None
+            if resolved:
+                return resolved
+        return None
 
-        def search_in(category: str) -> Optional[str]:
-            try:
-                available = folder_paths.get_filename_list(category)
-            except Exception:
-                return None
-            best, best_score = None, -1
-            for rel in available:
-                p = Path(rel)
-                rel_norm = str(p).replace("\\", "/").lower()
-                if rel_norm == provided_norm:
-                    return folder_paths.get_full_path(category, rel)
-                score = -1
-                if p.name.lower() == target_base:
-                    score = 100
-                elif not target_has_ext and p.stem.lower() == target_stem:
-                    score = 50
-                if score > -1:
-                    if "/" in provided_norm and provided_norm in rel_norm:
-                        score += 25
-                    if score > best_score:
-                        best_score = score
-                        best = rel
-            return folder_paths.get_full_path(category, best) if best else None
-
-        resolved = search_in("checkpoints")
-        if resolved:
-            return resolved
-        return search_in("diffusion_models")
+    @staticmethod
+    def read_keys(file_path: Path) -> Optional[List[str]]:
+        """Tensor keys from a safetensors header, or None for other formats."""
+        if file_path.suffix.lower() != ".safetensors":
+            return None
+        try:
+            header = HeaderCache.get(file_path)
+        except (OSError, ValueError) as e:
+            logging.warning(f"{LOG_PREFIX} Could not read header of {file_path.name}: {e}")
+            return None
+        return list(header.keys)
 
     @staticmethod
     def compute_stats(
-        file_path: Path, arch: str = "UNKNOWN"
+        file_path: Path,
+        arch: str = "UNKNOWN",
+        effective: bool = False,
+        layout: Optional[KeyLayout] = None,
     ) -> Optional[Dict[str, Any]]:
+        """
+        Per-block energy of a LoRA file.
+        By default every tensor's Frobenius norm is summed into its block.
+        With `effective`, plain LoRA modules contribute the norm of their actual
+        weight change, ||alpha / rank * up @ down||, instead (see `effective_norms`).
+        Keys are mapped to blocks through `layout`, built from the file's keys
+        when not given.
+        """
         try:
             block_data = {}
             block_metadata = {}
             total_norm = 0.0
 
-            def process_tensor(k, w, total_layers):
+            def add_norm(k, norm, layout):
                 nonlocal total_norm
 
-                try:
-                    norm = torch.norm(w.float()).item() if w.dim() >= 1 else 0.01
-                except (RuntimeError, TypeError):
-                    norm = 0.01
-
                 total_norm += norm
 
-                block_id, tag = BlockMapper.get_info(k, arch, total_layers)
+                block_id, tag = layout.info(k)
 
                 block_data[block_id] = block_data.get(block_id, 0.0) + norm
 
                 if block_id not in block_metadata:
                     block_metadata[block_id] = {
                         "tag": tag,
-                        "group": BlockMapper.get_group(block_id),
+                        "group": layout.group(block_id),
                     }
 
+            def process_tensor(k, w, layout):
+                add_norm(k, LoraOps._tensor_norm(w), layout)
+
+            if effective:
+                if HAS_SAFETENSORS and file_path.suffix.lower() == ".safetensors":
+                    header = HeaderCache.get(file_path)
+                    keys = header.keys
+                    with safe_open(file_path, framework="pt", device="cpu") as f:
+                        norms = LoraOps.effective_norms(keys, f.get_tensor, header.shape)
+                else:
+                    lora = LoraOps.load_lazy(file_path)
+                    if not lora:
+                        return None
+                    keys = list(lora.keys())
+                    norms = LoraOps.effective_norms(keys, lora.__getitem__)
+
+                layout = layout or KeyLayout.from_keys(keys, arch)
+                for k in keys:
+                    if k in norms:
+                        add_norm(k, norms[k], layout)
+                return LoraOps._finalize_stats(total_norm, block_data, block_metadata)
+
+            # Keys already added to the totals; a fallback continues after them
+            # instead of starting over.
+            processed = set()
+
+            if (
+                HAS_NUMPY
+                and HAS_SAFETENSORS
+                and file_path.suffix.lower() == ".safetensors"
+            ):
+                # Norms straight off the mmap'd file; only keys with dtypes
+                # NumPy can't view are read through safe_open.
+                try:
+                    keys = HeaderCache.get(file_path).keys
+                    layout = layout or KeyLayout.from_keys(keys, arch)
+                    norms = tensor_norms(file_path, keys)
+                    missing = [k for k in keys if k not in norms]
+                    if missing:
+                        with safe_open(file_path, framework="pt", device="cpu") as f:
+                            for k in missing:
+                                tensor = f.get_tensor(k)
+                                norms[k] = LoraOps._tensor_norm(tensor)
+                                del tensor
+                    for k in keys:
+                        add_norm(k, norms[k], layout)
+                        processed.add(k)
+                except Exception as e:
+                    logging.warning(
+                        f"{LOG_PREFIX} Memory-mapped analysis failed, retrying with safe_open: {e}"
+                    )
+                else:
+                    return LoraOps._finalize_stats(
+                        total_norm, block_data, block_metadata
+                    )
+
             if HAS_SAFETENSORS and file_path.suffix.lower() == ".safetensors":
                 try:
                     with safe_open(file_path, framework="pt", device="cpu") as f:
                         keys = f.keys()
-
-                        max_layer_idx = 0
-                        for k in keys:
-                            m = re.search(r"(?:layers|blocks|h)[\._](\d+)", k)
-                            if m:
-                                max_layer_idx = max(max_layer_idx, int(m.group(1)))
-                        total_layers = max_layer_idx + 1
+                        layout = layout or KeyLayout.from_keys(keys, arch)
 
                         for k in keys:
+                            if k in processed:
+                                continue
                             tensor = f.get_tensor(k)
-                            process_tensor(k, tensor, total_layers)
+                            process_tensor(k, tensor, layout)
+                            processed.add(k)
                             del tensor
 
                 except Exception as e:
                     logging.warning(
-                        f"{LOG_PREFIX} Streaming failed, falling back to full load: {e}"
+                        f"{LOG_PREFIX} Streaming failed after {len(processed)} tensors, "
+                        f"loading the rest: {e}"
                     )
-
-                    pass
                 else:
                     return LoraOps._finalize_stats(
                         total_norm, block_data, block_metadata
                     )
 
-            lora = comfy.utils.load_torch_file(str(file_path), safe_load=True)
+            lora = LoraOps.load_lazy(file_path)
             if not lora:
                 return None
 
-            max_layer_idx = 0
-            for k in lora.keys():
-                m = re.search(r"(?:layers|blocks|h)[\._](\d+)", k)
-                if m:
-                    max_layer_idx = max(max_layer_idx, int(m.group(1)))
-            total_layers = max_layer_idx + 1
+            layout = layout or KeyLayout.from_keys(lora.keys(), arch)
 
-            for k, w in lora.items():
-                process_tensor(k, w, total_layers)
+            for k in list(lora.keys()):
+                if k in processed:
+                    continue
+                # Drop each tensor once counted, so a fully loaded dict
+                # shrinks as it is walked.
+                process_tensor(k, lora.pop(k), layout)
 
             return LoraOps._finalize_stats(total_norm, block_data, block_metadata)
 
@@ -543,12 +754,122 @@ class LoraOps:
             logging.error(f"{LOG_PREFIX} Analysis failed: {e}")
             return None
 
+    @staticmethod
+    def load_lazy(file_path: Path) -> Optional[Dict[str, Any]]:
+        """
+        State dict of a LoRA file for read-only analysis.
+        Pickle-based files (.ckpt/.pt/.pth/.bin) are opened with
+        `torch.load(mmap=True)`, so tensors are paged in from the file as they
+        are read instead of being copied into RAM up front. Legacy (non-zip)
+        pickles and safetensors go through `comfy.utils.load_torch_file`.
+        """
+        if file_path.suffix.lower() not in (".safetensors", ".sft"):
+            try:
+                sd = torch.load(
+                    str(file_path), map_location="cpu", weights_only=True, mmap=True
+                )
+            except Exception as e:
+                logging.debug(f"{LOG_PREFIX} mmap load unavailable for {file_path.name}: {e}")
+            else:
+                # Same unwrapping as comfy.utils.load_torch_file.
+                if isinstance(sd, dict) and "state_dict" in sd:
+                    sd = sd["state_dict"]
+                elif isinstance(sd, dict) and len(sd) == 1:
+                    inner = next(iter(sd.values()))
+                    if isinstance(inner, dict):
+                        sd = inner
+                if isinstance(sd, dict):
+                    return sd
+
+        return comfy.utils.load_torch_file(str(file_path), safe_load=True)
+
+    @staticmethod
+    def _tensor_norm(w) -> float:
+        try:
+            return torch.norm(w.float()).item() if w.dim() >= 1 else 0.01
+        except (RuntimeError, TypeError):
+            return 0.01
+
+    # Upper bound on fp32 elements stacked into one batched Gram computation.
+    EFFECTIVE_BATCH_ELEMENTS = 32 * 1024 * 1024
+
+    @classmethod
+    def effective_norms(cls, keys, get_tensor, get_shape=None) -> Dict[str, float]:
+        """
+        Norms of the weight change each module applies, keyed by one
+        representative tensor key per module.
+
+        For a plain LoRA/LoCon module ||up @ down||_F is computed in rank space,
+        sqrt(sum((Uᵀ U) * (D Dᵀ))), so only r x r Gram matrices are formed.
+        Modules with the same factor shapes are stacked and reduced together.
+        The result is scaled by alpha / rank, as ComfyUI does when patching.
+        Any other tensor (mid/LoHa/LoKr factors, diffs, ...) keeps its own norm.
+        """
+        modules = {}
+        for key in keys:
+            prefix, suffix = cls._split_lora_module(key)
+            modules.setdefault(prefix, {})[suffix] = key
+
+        if get_shape is None:
+
+            def get_shape(k):
+                return get_tensor(k).shape
+
+        norms = {}
+        batches = {}
+        for prefix, parts in modules.items():
+            up_key = parts.get(".lora_up.weight") or parts.get(".lora_B.weight")
+            down_key = parts.get(".lora_down.weight") or parts.get(".lora_A.weight")
+            expected = 2 + (".alpha" in parts)
+            shapes = None
+            if up_key and down_key and len(parts) == expected:
+                up_shape = tuple(get_shape(up_key))
+                down_shape = tuple(get_shape(down_key))
+                rank = down_shape[0] if down_shape else 0
+                if (
+                    len(up_shape) >= 2
+                    and rank > 0
+                    and up_shape[1] == rank
+                    and all(d == 1 for d in up_shape[2:])
+                ):
+                    shapes = (up_shape, down_shape)
+
+            if shapes is None:
+                for key in parts.values():
+                    norms[key] = cls._tensor_norm(get_tensor(key))
+                continue
+
+            scale = 1.0
+            if ".alpha" in parts:
+                scale = float(get_tensor(parts[".alpha"]).float().item()) / shapes[1][0]
+            batches.setdefault(shapes, []).append((up_key, down_key, scale))
+
+        for (up_shape, down_shape), group in batches.items():
+            per_module = max(1, math.prod(up_shape) + math.prod(down_shape))
+            size = max(1, cls.EFFECTIVE_BATCH_ELEMENTS // per_module)
+            for i in range(0, len(group), size):
+                chunk = group[i : i + size]
+                up = torch.stack(
+                    [get_tensor(u).float().reshape(up_shape[0], -1) for u, _, _ in chunk]
+                )
+                down = torch.stack(
+                    [get_tensor(d).float().reshape(down_shape[0], -1) for _, d, _ in chunk]
+                )
+                gram_up = torch.bmm(up.transpose(1, 2), up)
+                gram_down = torch.bmm(down, down.transpose(1, 2))
+                sq = (gram_up * gram_down).sum(dim=(1, 2)).clamp_min(0.0)
+                for (up_key, _, scale), value in zip(chunk, sq.sqrt().tolist()):
+                    norms[up_key] = value * abs(scale)
+                del up, down, gram_up, gram_down
+
+        return norms
+
     @staticmethod
     def _finalize_stats(total_norm, block_data, block_metadata):
         """Helper to finalize and return stats dictionary."""
-        energy_values = list(block_data.values())
-        sparsity = float(AnalysisMath.calculate_gini(energy_values))
-        bias = float(AnalysisMath.calculate_bias(block_data))
+        metrics = AnalysisMath.batch_metrics([block_data])[0]
+        sparsity = metrics["sparsity"]
+        bias = metrics["balance"]
 
         return {
             "total_energy": float(total_norm),
@@ -559,35 +880,261 @@ class LoraOps:
         }
 
     @classmethod
-    def apply_lbw(cls, lora, arch, name, vectors=None):
+    def apply_lbw(cls, lora, arch, name, vectors=None, zero_copy=False, layout=None):
+        """
+        Scales LoRA tensors by their block vector, using `layout` (built from
+        `lora` when not given) to map keys to blocks.
+        Tensors whose scalar is 1.0 are passed through by reference.
+        With `zero_copy`, plain LoRA modules fold the scalar into their alpha
+        instead of copying the up/down projections (see `_apply_lbw_folded`).
+        """
         new_lora = {}
         has_vectors = vectors is not None and len(vectors) > 0
 
-        max_layer_idx = 0
-        for k in lora.keys():
-            m = re.search(r"(?:layers|blocks|h)[\._](\d+)", k)
-            if m:
-                max_layer_idx = max(max_layer_idx, int(m.group(1)))
-        total_layers = max_layer_idx + 1
+        if layout is None:
+            layout = KeyLayout.from_keys(lora.keys(), arch)
 
-        for key, tensor in lora.items():
+        scalars = {}
+        for key in lora.keys():
             scalar = 1.0
-            block_id, tag = BlockMapper.get_info(key, arch, total_layers)
+            block_id, tag = layout.info(key)
             if has_vectors:
                 scalar = float(vectors.get(block_id, 1.0))
-            new_lora[key] = tensor * scalar
+            scalars[key] = scalar
+
+        if zero_copy:
+            return cls._apply_lbw_folded(lora, scalars)
+
+        for key, tensor in lora.items():
+            scalar = scalars[key]
+            new_lora[key] = tensor if scalar == 1.0 else tensor * scalar
+
+        return new_lora
+
+    _LORA_FACTOR_SUFFIXES = (
+        ".lora_up.weight",
+        ".lora_down.weight",
+        ".lora_mid.weight",
+        ".lora_B.weight",
+        ".lora_A.weight",
+        ".alpha",
+    )
+
+    @classmethod
+    def _split_lora_module(cls, key: str) -> Tuple[str, str]:
+        for suffix in cls._LORA_FACTOR_SUFFIXES:
+            if key.endswith(suffix):
+                return key[: -len(suffix)], suffix
+        return key, ""
+
+    @classmethod
+    def _apply_lbw_folded(cls, lora, scalars):
+        """
+        Zero-copy variant of apply_lbw.
+
+        The copying path multiplies every tensor of a module by its scalar, so a
+        plain LoRA module (up, down, optional mid and alpha) ends up with its delta
+        scaled by scalar ** n_tensors. The same delta is produced here by folding
+        that factor into the module's alpha (or adding one, alpha = rank), which
+        leaves the up/down projections untouched and shared with `lora`.
+        Modules scaled to 0 are dropped, so they are never patched.
+        Any other module layout falls back to copying its tensors.
+        """
+        modules = {}
+        for key in lora.keys():
+            prefix, suffix = cls._split_lora_module(key)
+            modules.setdefault(prefix, {})[suffix] = key
+
+        new_lora = {}
+        for prefix, parts in modules.items():
+            module_scalars = {scalars[k] for k in parts.values()}
+            scalar = module_scalars.pop() if len(module_scalars) == 1 else None
+
+            if scalar == 1.0:
+                for key in parts.values():
+                    new_lora[key] = lora[key]
+                continue
+            if scalar == 0.0:
+                continue
+
+            up_key = parts.get(".lora_up.weight") or parts.get(".lora_B.weight")
+            down_key = parts.get(".lora_down.weight") or parts.get(".lora_A.weight")
+            expected = 2 + (".lora_mid.weight" in parts) + (".alpha" in parts)
+            if scalar is None or not up_key or not down_key or len(parts) != expected:
+                for key in parts.values():
+                    new_lora[key] = lora[key] * scalars[key]
+                continue
+
+            factor = scalar ** len(parts)
+            for key in parts.values():
+                new_lora[key] = lora[key]
+            alpha_key = parts.get(".alpha", f"{prefix}.alpha")
+            if ".alpha" in parts:
+                alpha = lora[alpha_key].float() * factor
+            else:
+                rank = lora[down_key].shape[0]
+                alpha = torch.tensor(rank * factor, dtype=torch.float32)
+            new_lora[alpha_key] = alpha
 
         return new_lora
 
+    # Other LoRA layouts whose factor names span several dotted components.
+    _DOTTED_FACTOR_SUFFIXES = (
+        ".lora.up.weight",
+        ".lora.down.weight",
+        ".lora_linear_layer.up.weight",
+        ".lora_linear_layer.down.weight",
+    )
+
+    @classmethod
+    def _module_of(cls, key: str) -> Tuple[str, str]:
+        """(module prefix, suffix) of any adapter key (LoRA, LoHa, LoKr, diff, ...)."""
+        prefix, suffix = cls._split_lora_module(key)
+        if suffix or "." not in key:
+            return prefix, suffix
+        for suffix in cls._DOTTED_FACTOR_SUFFIXES:
+            if key.endswith(suffix):
+                return key[: -len(suffix)], suffix
+        prefix, suffix = key.rsplit(".", 1)
+        return prefix, "." + suffix
+
+    @classmethod
+    def key_roots(cls, lora) -> frozenset:
+        """
+        Naming roots of a LoRA's modules: the first two dotted components, or
+        the first three `_` tokens of kohya-style names (`lora_unet_input`
+        vs `lora_unet_down`). LoRAs whose roots are nested use one naming
+        scheme and can share a state dict without two names reaching the
+        same weight.
+        """
+        roots = set()
+        for key in lora.keys():
+            prefix = cls._module_of(key)[0]
+            if "." in prefix:
+                roots.add(".".join(prefix.split(".")[:2]))
+            else:
+                roots.add("_".join(prefix.split("_")[:3]))
+        return frozenset(roots)
+
+    @classmethod
+    def merge_loras(cls, loras: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """
+        Merges LoRAs applied with the same strengths and keyframes into one
+        state dict, so each weight gets one patch instead of one per LoRA.
+
+        Plain LoRA modules (up, down, optional alpha) of the same dtype
+        present in several LoRAs are concatenated along the rank: each up is
+        scaled by its alpha / rank, and the result gets alpha = total rank,
+        which gives the same delta as the separate patches. Modules present
+        in one LoRA are passed through by reference. Modules that can't be
+        concatenated (mid, DoRA, LoHa, mismatched shapes or dtypes) stay with
+        the first LoRA that has them and go to a per-LoRA residual dict for
+        the others.
+        Returns (merged, residuals), residuals with one (possibly empty) dict
+        per input LoRA.
+        """
+        modules: Dict[str, List[Tuple[int, Dict[str, str]]]] = {}
+        for i, lora in enumerate(loras):
+            parts_by_prefix: Dict[str, Dict[str, str]] = {}
+            for key in lora.keys():
+                prefix, suffix = cls._module_of(key)
+                parts_by_prefix.setdefault(prefix, {})[suffix] = key
+            for prefix, parts in parts_by_prefix.items():
+                modules.setdefault(prefix, []).append((i, parts))
+
+        merged: Dict[str, Any] = {}
+        residuals: List[Dict[str, Any]] = [{} for _ in loras]
+        for prefix, owners in modules.items():
+            if len(owners) == 1:
+                i, parts = owners[0]
+                for key in parts.values():
+                    merged[key] = loras[i][key]
+                continue
+
+            plain = []
+            for i, parts in owners:
+                factors = cls._plain_factors(loras[i], parts)
+                if factors is not None:
+                    plain.append((i, parts, factors))
+            plain = cls._concatenable(plain)
+            if len(plain) < 2:
+                plain = []
+
+            if plain:
+                cls._concat_module(prefix, plain, merged)
+                done = {i for i, _, _ in plain}
+            else:
+                i, parts = owners[0]
+                for key in parts.values():
+                    merged[key] = loras[i][key]
+                done = {i}
+            for i, parts in owners:
+                if i not in done:
+                    for key in parts.values():
+                        residuals[i][key] = loras[i][key]
+        return merged, residuals
+
+    @staticmethod
+    def _plain_factors(lora, parts):
+        up_suffix = ".lora_up.weight" if ".lora_up.weight" in parts else ".lora_B.weight"
+        down_suffix = ".lora_down.weight" if ".lora_down.weight" in parts else ".lora_A.weight"
+        if up_suffix not in parts or down_suffix not in parts:
+            return None
+        if len(parts) != 2 + (".alpha" in parts):
+            return None
+        up = lora[parts[up_suffix]]
+        down = lora[parts[down_suffix]]
+        if up.dim() < 2 or down.dim() < 2 or up.shape[1] != down.shape[0]:
+            return None
+        rank = down.shape[0]
+        alpha = float(lora[parts[".alpha"]]) if ".alpha" in parts else float(rank)
+        return up, down, alpha / rank, up_suffix, down_suffix
+
+    @staticmethod
+    def _concatenable(plain):
+        """
+        The plain modules sharing the first one's weight shape, layout, dtype
+        and device, so concatenating them never promotes (fp16 + bf16 would
+        become fp32).
+        """
+        if not plain:
+            return plain
+        up0, down0 = plain[0][2][0], plain[0][2][1]
+        return [
+            entry
+            for entry in plain
+            if entry[2][0].shape[0] == up0.shape[0]
+            and entry[2][0].shape[2:] == up0.shape[2:]
+            and entry[2][1].shape[1:] == down0.shape[1:]
+            and entry[2][0].device == up0.device
+            and entry[2][0].dtype == up0.dtype
+            and entry[2][1].dtype == down0.dtype
+        ]
+
+    @staticmethod
+    def _concat_module(prefix, plain, merged):
+        ups = [
+            (up.float() * scale).to(up.dtype) if scale != 1.0 else up
+            for _, _, (up, _, scale, _, _) in plain
+        ]
+        downs = [down for _, _, (_, down, _, _, _) in plain]
+        _, _, (_, _, _, up_suffix, down_suffix) = plain[0]
+        merged[prefix + up_suffix] = torch.cat(ups, dim=1)
+        merged[prefix + down_suffix] = torch.cat(downs, dim=0)
+        rank = merged[prefix + down_suffix].shape[0]
+        merged[prefix + ".alpha"] = torch.tensor(float(rank), dtype=torch.float32)
+
     @staticmethod
     def get_vectors_for_preset(
         arch: str,
         preset_name: str,
         available_blocks: List[str],
         block_metadata: Dict[str, Any],
+        layout: Optional[KeyLayout] = None,
     ) -> Dict[str, float]:
         """
         Generates a vector dictionary for a specific preset and architecture.
+        Block tags come from `block_metadata`, then `layout`.
         """
         if not preset_name or preset_name not in UI_CONFIG["PRESET_STRATEGIES"]:
             return {}
@@ -598,6 +1145,8 @@ class LoraOps:
         for block_id in available_blocks:
             if block_id in block_metadata:
                 tag = block_metadata[block_id].get("tag", "OTHER")
+            elif layout is not None and block_id in layout.block_tags:
+                tag = layout.block_tags[block_id]
             else:
                 _, tag = BlockMapper.get_info(block_id, arch)
 
@@ -612,25 +1161,8 @@ class LoraOps:
     @staticmethod
     def extract_triggers(lora_path: Path) -> List[str]:
         triggers = []
-        candidates = [
-            lora_path.with_name(f"{lora_path.stem}.metadata.json"),
-            lora_path.with_name(f"{lora_path.stem}.json"),
-        ]
-        for json_path in candidates:
-            if not json_path.exists():
-                continue
-            try:
-                with open(json_path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    tw = data.get("trainedWords") or data.get("civitai", {}).get(
-                        "trainedWords"
-                    )
-                    if isinstance(tw, list):
-                        triggers.extend(
-                            [str(t) for t in tw if isinstance(t, (str, int, float))]
-                        )
-            except (OSError, json.JSONDecodeError):
-                continue
+        for fields in SidecarCache.for_lora(lora_path):
+            triggers.extend(fields["trained_words"])
         return triggers
 
     @staticmethod
@@ -749,7 +1281,427 @@ class LoraOps:
         return lora_list
 
 
+class KeyframeSchedule:
+    """
+    Keyframe reduction for scheduled hooks.
+
+    A hook keyframe holds its strength until the next keyframe starts, and
+    every strength change while sampling re-patches the hooked weights.
+    `simplify` turns a drawn curve into keyframes, dropping points that
+    repeat the strength already in effect; with `TOLERANCE` set it also
+    skips changes up to that size. `fit` fits a hook's keyframes to the
+    sampler's steps once per run: ComfyUI advances at most one keyframe per
+    step, so keyframes that fall due before the same step are merged into one
+    carrying the last one's strength, and keyframes that only fall due after
+    the last step are dropped. This assumes one model evaluation per step,
+    which FittedKeyframes checks on every call.
+    """
+
+    # Largest strength change that is skipped instead of becoming a keyframe
+    # (0 keeps every point that changes the strength).
+    TOLERANCE = max(0.0, env_float("KEYFRAME_TOLERANCE", 0.0))
+    SNAP_TO_STEPS = env_flag("KEYFRAME_SNAP", True)
+
+    @classmethod
+    def simplify(cls, points, tolerance: Optional[float] = None) -> List[Tuple[float, float]]:
+        """
+        (start_percent, strength) pairs for the keyframes of a curve, from
+        points sorted by x. Of several points at the same x the last wins.
+        """
+        if tolerance is None:
+            tolerance = cls.TOLERANCE
+        kept: List[Tuple[float, float]] = []
+        for pt in points:
+            x, y = float(pt["x"]), float(pt["y"])
+            if kept and x <= kept[-1][0]:
+                kept.pop()
+            if not kept or abs(y - kept[-1][1]) > tolerance:
+                kept.append((x, y))
+        return kept
+
+    @classmethod
+    def fit(cls, group, sigmas, model_sampling) -> Optional["FittedKeyframes"]:
+        """
+        FittedKeyframes for `group` over `sigmas`, or None if every keyframe
+        of it can fire (or it has guaranteed steps, which aren't fitted).
+        """
+        source = list(group.keyframes)
+        if len(source) < 2 or not hasattr(group, "_current_index"):
+            return None
+        if not all(getattr(kf, "guarantee_steps", 1) == 1 for kf in source):
+            return None
+        # The last sigma is where sampling ends; the model never runs there.
+        steps = [float(s) for s in sigmas.flatten().tolist()][:-1]
+        keyframes, origins = cls._fit_to_steps(source, steps, model_sampling)
+        if len(keyframes) == len(source):
+            return None
+        return FittedKeyframes(group, source, keyframes, origins, steps)
+
+    @classmethod
+    def _fit_to_steps(cls, source, steps, model_sampling) -> Tuple[List[Any], List[int]]:
+        """(fitted keyframes, index in `source` of the last keyframe each stands for)."""
+        # The first keyframe is current at the first step; any other keyframe
+        # fires at the first later step whose sigma is at or below its start.
+        compiled = [(source[0], 0)]
+        window: List[int] = []
+        step = 1
+        for i in range(1, len(source)):
+            start = float(model_sampling.percent_to_sigma(source[i].start_percent))
+            while step < len(steps) and steps[step] > start:
+                if window:
+                    compiled.append(cls._merge(source, window))
+                    window = []
+                step += 1
+            if step >= len(steps):
+                break
+            window.append(i)
+        if window:
+            compiled.append(cls._merge(source, window))
+
+        keyframes, origins = [compiled[0][0]], [compiled[0][1]]
+        for kf, origin in compiled[1:]:
+            if kf.strength != keyframes[-1].strength:
+                keyframes.append(kf)
+                origins.append(origin)
+        return keyframes, origins
+
+    @staticmethod
+    def _merge(source, window) -> Tuple[Any, int]:
+        """One keyframe at the first one's start with the last one's strength."""
+        first, last = source[window[0]], source[window[-1]]
+        if len(window) == 1:
+            return first, window[0]
+        merged = first.clone() if hasattr(first, "clone") else copy.copy(first)
+        merged.strength = last.strength
+        return merged, window[-1]
+
+    @classmethod
+    def coalesce_hooks(cls, patcher, hook_group, model_options) -> List["FittedKeyframes"]:
+        """
+        FittedKeyframes for every group of `hook_group` whose keyframes don't
+        all fire in the current run. They are fitted once per run and kept on
+        the patcher; the groups themselves are not changed.
+        """
+        transformer_options = (model_options or {}).get("transformer_options", {})
+        sigmas = transformer_options.get("sample_sigmas")
+        model_sampling = getattr(patcher.model, "model_sampling", None)
+        if sigmas is None or hook_group is None:
+            return []
+        if not hasattr(model_sampling, "percent_to_sigma"):
+            return []
+        run = getattr(patcher, "_mad_keyframe_run", None)
+        if run is None or run[0] is not sigmas or run[1] is not model_sampling:
+            run = (sigmas, model_sampling, {})
+            patcher._mad_keyframe_run = run
+        groups = run[2]
+        fitted = []
+        for hook in getattr(hook_group, "hooks", ()):
+            group = getattr(hook, "hook_keyframe", None)
+            if group is None:
+                continue
+            if id(group) not in groups:
+                groups[id(group)] = cls.fit(group, sigmas, model_sampling)
+            entry = groups[id(group)]
+            if entry is not None and entry not in fitted:
+                fitted.append(entry)
+        return fitted
+
+
+class FittedKeyframes:
+    """
+    Steps a hook keyframe group over keyframes fitted to a run's steps
+    (KeyframeSchedule.fit). The fitted keyframes and the progress through
+    them live on a private group; after each call the user's group is set to
+    the keyframe of its own list that the current fitted one stands for, so
+    its state always refers to its own keyframes.
+
+    Fitting assumes one model evaluation per step. Samplers that evaluate
+    between steps (dpm_2, the *_2s/*_3m families, ...) or skip a step are
+    caught by the first call whose sigma isn't the current or next step, and
+    from then on the user's group is stepped by ComfyUI's own logic for the
+    rest of the run.
+    """
+
+    def __init__(self, group, source, keyframes, origins, steps):
+        self.group = group
+        self.source = source
+        self.keyframes = keyframes
+        self.origins = origins
+        self.steps = steps
+        self._restart()
+
+    def _restart(self) -> None:
+        self.shadow = type(self.group)()
+        self.shadow.keyframes = list(self.keyframes)
+        self.shadow.reset()
+        self.position = -1
+        self.fits = True
+
+    def _is_step(self, t: float, position: int) -> bool:
+        return 0 <= position < len(self.steps) and math.isclose(
+            t, self.steps[position], rel_tol=1e-6
+        )
+
+    def prepare_current_keyframe(self, curr_t, transformer_options) -> bool:
+        """Stands in for group.prepare_current_keyframe while ComfyUI calls it."""
+        group = self.group
+        t = float(curr_t)
+        if self.position > 0 and self._is_step(t, 0):
+            # A new run over the same sigmas.
+            self._restart()
+        if self.fits:
+            for position in (self.position, self.position + 1):
+                if self._is_step(t, position):
+                    self.position = position
+                    break
+            else:
+                self.fits = False
+        if not self.fits:
+            return type(group).prepare_current_keyframe(group, curr_t, transformer_options)
+
+        shadow = self.shadow
+        changed = shadow.prepare_current_keyframe(curr_t, transformer_options)
+        index = self.origins[shadow._current_index]
+        group._current_index = index
+        group._current_keyframe = self.source[index]
+        group._current_strength = shadow._current_strength
+        group._current_used_steps = shadow._current_used_steps
+        group._curr_t = shadow._curr_t
+        return changed
+
+
+class HookPatchPlan:
+    """
+    Batched weight computation for one `patch_hooks` pass.
+
+    Keys whose patches are all plain LoRA terms (up @ down, no mid/DoRA/
+    reshape/offset/function) are grouped by weight shape, dtype, device and
+    per-term ranks. Each group gets an equal share of `max_bytes` and is cut
+    into batches that fit it, so all groups' buffers together stay within
+    `max_bytes`; groups where one key exceeds the share are not batched and
+    go through calculate_weight. A batch is computed on first use as one fp32
+    [n, out, in] stack with one `baddbmm_` per LoRA term (or `addmm_` for a
+    single key), in a scratch buffer shared by all batches of its group and
+    freed after the group's last batch. A key is sized with its share of the
+    fp32 factor stacks of its largest term, which live next to the buffer
+    while that term is applied. Batches are formed in
+    `combined_patches` order, which is the order ModelPatcher visits keys,
+    so a batch is fully consumed before the next one of its group reuses
+    the buffer; groups may interleave freely. Keys in `skip` (already
+    available from the patched-weight cache) are left out.
+    """
+
+    def __init__(
+        self, model, combined_patches: Dict[str, list], max_bytes: int, skip=()
+    ):
+        self.combined_patches = combined_patches
+        self.max_bytes = max(0, int(max_bytes))
+        self._batches: Dict[str, Dict[str, Any]] = {}
+        self._scratch: Dict[tuple, torch.Tensor] = {}
+
+        groups: Dict[tuple, List[Tuple[str, torch.Tensor, list]]] = {}
+        for key, patches in combined_patches.items():
+            if key in skip:
+                continue
+            entry = self._plain_terms(model, key, patches)
+            if entry is None:
+                continue
+            weight, terms = entry
+            sig = (
+                tuple(weight.shape),
+                weight.dtype,
+                weight.device,
+                tuple(t[2].shape[0] for t in terms),
+            )
+            groups.setdefault(sig, []).append((key, weight, terms))
+
+        # Groups are visited interleaved, so each one holds its own buffer
+        # and gets an equal share of the budget. Dropping a group whose
+        # key doesn't fit its share leaves more for the others.
+        share = 0
+        while groups:
+            share = self.max_bytes // len(groups)
+            fitting = {
+                sig: members
+                for sig, members in groups.items()
+                if 0 < self._key_bytes(sig) <= share
+            }
+            if len(fitting) == len(groups):
+                break
+            groups = fitting
+
+        for sig, members in groups.items():
+            size = share // self._key_bytes(sig)
+            for i in range(0, len(members), size):
+                batch = {
+                    "sig": sig,
+                    "members": members[i : i + size],
+                    "results": None,
+                    "pending": 0,
+                    "last": i + size >= len(members),
+                }
+                for key, _, _ in batch["members"]:
+                    self._batches[key] = batch
+        self._remaining = len(self._batches)
+
+    @staticmethod
+    def _key_bytes(sig: tuple) -> int:
+        """fp32 bytes one key of a group needs: its weight plus its factors."""
+        shape, _, _, ranks = sig
+        numel = math.prod(shape)
+        if numel == 0:
+            return 0
+        out_dim = shape[0]
+        in_dim = numel // out_dim
+        return 4 * (numel + max(ranks) * (out_dim + in_dim))
+
+    @staticmethod
+    def _lora_factors(v) -> Optional[Tuple[torch.Tensor, torch.Tensor, Any]]:
+        """(up, down, alpha) of a plain LoRA patch value, else None."""
+        weights = None
+        if getattr(v, "name", None) == "lora" and hasattr(v, "weights"):
+            weights = v.weights
+        elif isinstance(v, tuple) and len(v) == 2 and v[0] == "lora":
+            weights = v[1]
+        if not isinstance(weights, (tuple, list)) or len(weights) < 6:
+            return None
+        up, down, alpha, mid, dora_scale, reshape = weights[:6]
+        if mid is not None or dora_scale is not None or reshape is not None:
+            return None
+        if not isinstance(up, torch.Tensor) or not isinstance(down, torch.Tensor):
+            return None
+        return up, down, alpha
+
+    @classmethod
+    def lora_terms(cls, patches, weight) -> Optional[List[tuple]]:
+        """
+        (patch value, strength, alpha / rank, up2d, down2d) for every patch,
+        zero strengths included, if all of them are plain LoRA terms whose
+        up2d @ down2d matches `weight`; otherwise None.
+        """
+        if (
+            not isinstance(weight, torch.Tensor)
+            or not weight.is_floating_point()
+            or weight.dim() < 2
+        ):
+            return None
+        out_dim = weight.shape[0]
+        in_dim = weight.numel() // out_dim
+
+        terms = []
+        for p in patches:
+            if len(p) < 5 or p[2] != 1.0 or p[3] is not None or p[4] is not None:
+                return None
+            factors = cls._lora_factors(p[1])
+            if factors is None:
+                return None
+            up, down, alpha = factors
+            up2 = up.reshape(up.shape[0], -1)
+            down2 = down.reshape(down.shape[0], -1)
+            rank = down2.shape[0]
+            if up2.shape != (out_dim, rank) or down2.shape[1] != in_dim:
+                return None
+            scale = float(alpha) / rank if alpha is not None else 1.0
+            terms.append((p[1], float(p[0]), scale, up2, down2))
+        return terms
+
+    @classmethod
+    def _plain_terms(cls, model, key, patches):
+        """(weight, [(coef, up2d, down2d), ...]) if every patch is a plain LoRA term."""
+        patches = [p for p in patches if not MadPatcherOverrides._is_zero(p[0])]
+        if not patches:
+            return None
+        try:
+            weight, _, convert_func = get_key_weight(model, key)
+        except (AttributeError, KeyError):
+            return None
+        if convert_func is not None:
+            return None
+        terms = cls.lora_terms(patches, weight)
+        if terms is None:
+            return None
+        return weight, [(strength * scale, up2, down2) for _, strength, scale, up2, down2 in terms]
+
+    def take(self, key: str, weight: torch.Tensor) -> Optional[torch.Tensor]:
+        """
+        Patched fp32 weight for `key` (a view into the scratch buffer), or
+        None if the key is not batched. Computes the key's batch on first use.
+        """
+        batch = self._batches.pop(key, None)
+        if batch is None:
+            return None
+        self._remaining -= 1
+        if batch["results"] is None:
+            self._compute(batch)
+        index = batch["index"][key]
+        batch["pending"] -= 1
+        result = batch["results"][index].view(weight.shape)
+        if batch["pending"] == 0:
+            batch["results"] = None
+            if batch["last"]:
+                self._scratch.pop(batch["sig"], None)
+        return result
+
+    @property
+    def finished(self) -> bool:
+        """True once every batched key has been taken."""
+        return self._remaining <= 0
+
+    def release(self) -> None:
+        self._scratch.clear()
+
+    def _compute(self, batch: Dict[str, Any]) -> None:
+        shape, _, device, ranks = batch["sig"]
+        members = batch["members"]
+        n = len(members)
+        out_dim = shape[0]
+        in_dim = math.prod(shape) // out_dim
+
+        scratch = self._scratch.get(batch["sig"])
+        if scratch is None or scratch.shape[0] < n:
+            scratch = torch.empty((n, out_dim, in_dim), dtype=torch.float32, device=device)
+            self._scratch[batch["sig"]] = scratch
+        results = scratch[:n]
+
+        for i, (_, weight, _) in enumerate(members):
+            results[i].copy_(weight.reshape(out_dim, in_dim))
+
+        if n == 1:
+            for coef, up2, down2 in members[0][2]:
+                up2 = comfy.model_management.cast_to_device(up2, device, torch.float32)
+                down2 = comfy.model_management.cast_to_device(down2, device, torch.float32)
+                results[0].addmm_(up2, down2, alpha=coef)
+        else:
+            for j, rank in enumerate(ranks):
+                ups = torch.empty((n, out_dim, rank), dtype=torch.float32, device=device)
+                downs = torch.empty((n, rank, in_dim), dtype=torch.float32, device=device)
+                coefs = []
+                for i, (_, _, terms) in enumerate(members):
+                    coef, up2, down2 = terms[j]
+                    ups[i].copy_(up2)
+                    downs[i].copy_(down2)
+                    coefs.append(coef)
+                ups.mul_(torch.tensor(coefs, dtype=torch.float32, device=device).view(n, 1, 1))
+                results.baddbmm_(ups, downs)
+                del ups, downs
+
+        batch["index"] = {key: i for i, (key, _, _) in enumerate(members)}
+        batch["pending"] = n
+        batch["results"] = results
+        # Weights and factors are only needed once.
+        batch["members"] = None
+
+
 class MadPatcherOverrides:
+    # Byte budget of all live batched fp32 weight stacks (0 disables batching).
+    PATCH_BATCH_BYTES = env_int("PATCH_BATCH_MB", 256) * 1024 * 1024
+    # Keyframe changes applied as deltas before a full recompute from the
+    # backups bounds rounding drift (0 always recomputes).
+    INCREMENTAL_REPATCH_LIMIT = env_int("INCREMENTAL_REPATCH_LIMIT", 8)
+    # Patched weights kept across sampling runs (MAD_NODES_PATCH_CACHE_MB).
+    WEIGHT_CACHE = PatchedWeightCache.from_env()
+    _TOKENS = itertools.count(1)
+
     @staticmethod
     def _is_zero(value):
         """
@@ -782,6 +1734,349 @@ class MadPatcherOverrides:
             clean_patches, weight, key, intermediate_dtype=intermediate_dtype
         )
 
+    @staticmethod
+    def _patch_plan(patcher, combined_patches, skip=()) -> Optional[HookPatchPlan]:
+        """
+        The HookPatchPlan of the current `patch_hooks` pass. ModelPatcher
+        hands the same `combined_patches` dict to every per-key call of a
+        pass, so a new dict means a new pass.
+        """
+        if MadPatcherOverrides.PATCH_BATCH_BYTES <= 0:
+            return None
+        plan = getattr(patcher, "_mad_patch_plan", None)
+        if plan is None or plan.combined_patches is not combined_patches:
+            plan = HookPatchPlan(
+                patcher.model,
+                combined_patches,
+                MadPatcherOverrides.PATCH_BATCH_BYTES,
+                skip=skip,
+            )
+            patcher._mad_patch_plan = plan
+        return plan
+
+    @staticmethod
+    def _token(obj) -> int:
+        """Process-unique id of a live object; never reused, unlike id()."""
+        token = getattr(obj, "_mad_token", None)
+        if token is None:
+            token = next(MadPatcherOverrides._TOKENS)
+            obj._mad_token = token
+        return token
+
+    @staticmethod
+    def _fingerprint(value):
+        """
+        Hashable identity of a patch value: tensors by token and version,
+        CPU scalars by value, weight adapters by class and weights. Raises
+        TypeError for anything else (callables, unknown objects).
+        """
+        if value is None or isinstance(value, (bool, int, float, str)):
+            return value
+        if isinstance(value, torch.Tensor):
+            if value.numel() == 1 and value.device.type == "cpu":
+                return ("s", value.item())
+            return ("t", MadPatcherOverrides._token(value), value._version)
+        if isinstance(value, (tuple, list)):
+            return tuple(MadPatcherOverrides._fingerprint(v) for v in value)
+        weights = getattr(value, "weights", None)
+        if weights is not None:
+            return (type(value).__name__, MadPatcherOverrides._fingerprint(weights))
+        raise TypeError(f"Unsupported patch value {type(value).__name__}")
+
+    @staticmethod
+    def _weight_cache_key(patcher, key, patches) -> Optional[tuple]:
+        """
+        (model token, static patches uuid, key, weight token and version,
+        dtype, shape, patch fingerprints) for a key written directly to its
+        parameter, or None if the key can't be cached. Strengths are part of
+        the fingerprints, so each keyframe strength is its own entry. Patching
+        writes through `.data`, which leaves the version alone; any other
+        in-place change to the base weight bumps it.
+        """
+        patches = [p for p in patches if not MadPatcherOverrides._is_zero(p[0])]
+        if not patches:
+            return None
+        try:
+            weight, set_func, convert_func = get_key_weight(patcher.model, key)
+        except (AttributeError, KeyError):
+            return None
+        if set_func is not None or convert_func is not None:
+            return None
+        uuid = getattr(patcher, "patches_uuid", None)
+        if uuid is None and getattr(patcher, "patches", None):
+            return None
+        try:
+            fingerprint = MadPatcherOverrides._fingerprint(patches)
+        except TypeError:
+            return None
+
+        model = patcher.model
+        owner = getattr(model, "_mad_token", None)
+        if owner is None:
+            owner = MadPatcherOverrides._token(model)
+            weakref.finalize(model, MadPatcherOverrides.WEIGHT_CACHE.discard_owner, owner)
+        return (
+            owner,
+            uuid,
+            key,
+            MadPatcherOverrides._token(weight),
+            weight._version,
+            weight.dtype,
+            tuple(weight.shape),
+            fingerprint,
+        )
+
+    @staticmethod
+    def _weight_cache_pass(patcher, combined_patches) -> Tuple[Dict[str, tuple], set]:
+        """
+        ({key: (cache key, cached weight or None)}, keys found) for the
+        current pass, looked up once on the pass's first key so cached keys
+        can be left out of the HookPatchPlan.
+        """
+        lookups = getattr(patcher, "_mad_weight_cache", None)
+        if lookups is None or lookups[0] is not combined_patches:
+            cache = MadPatcherOverrides.WEIGHT_CACHE
+            entries = {}
+            for key, patches in combined_patches.items():
+                cache_key = MadPatcherOverrides._weight_cache_key(patcher, key, patches)
+                if cache_key is not None:
+                    entries[key] = (cache_key, cache.get(cache_key))
+            found = {key for key, entry in entries.items() if entry[1] is not None}
+            lookups = (combined_patches, entries, found)
+            patcher._mad_weight_cache = lookups
+        return lookups[1], lookups[2]
+
+    @staticmethod
+    def _weight_cache_covers(patcher) -> bool:
+        """
+        True if every cacheable key of the current hooks is in the
+        patched-weight cache, so a full re-patch copies those weights and
+        only recomputes keys that can't be cached (which an incremental
+        update recomputes as well).
+        """
+        hooks = patcher.current_hooks
+        if not MadPatcherOverrides.WEIGHT_CACHE.enabled or hooks is None:
+            return False
+        cache = MadPatcherOverrides.WEIGHT_CACHE
+        combined_patches = patcher.get_combined_hook_patches(hooks=hooks)
+        found = False
+        for key, patches in combined_patches.items():
+            cache_key = MadPatcherOverrides._weight_cache_key(patcher, key, patches)
+            if cache_key is None:
+                continue
+            if cache_key not in cache:
+                return False
+            found = True
+        return found
+
+    @staticmethod
+    def _write_weight(patcher, key, weight, set_func, out_weight):
+        """Writes a patched fp32 weight back into the model; returns what was written."""
+        if set_func is None:
+            out_weight = comfy.float.stochastic_rounding(
+                out_weight, weight.dtype, seed=string_to_seed(key)
+            )
+            comfy.utils.copy_to_param(patcher.model, key, out_weight)
+        else:
+            set_func(out_weight, inplace_update=True, seed=string_to_seed(key))
+        return out_weight
+
+    @staticmethod
+    def _record_patch(patcher, hooks, combined_patches, key, weight, set_func, convert_func):
+        """
+        Remembers which LoRA terms, at which strengths, make up the weight
+        just written for `key`, so a later keyframe change can apply only the
+        difference (see `repatch_current_hooks`). Keys with anything other
+        than plain LoRA terms are recorded without terms.
+        """
+        state = getattr(patcher, "_mad_patch_state", None)
+        if state is None or state["patches"] is not combined_patches:
+            state = {"hooks": hooks, "patches": combined_patches, "keys": {}, "updates": 0}
+            patcher._mad_patch_state = state
+        terms = None
+        if set_func is None and convert_func is None:
+            terms = MadPatcherOverrides._term_strengths(combined_patches[key], weight)
+        state["keys"][key] = {
+            "param": weight,
+            "ptr": weight.data_ptr(),
+            "terms": terms,
+        }
+
+    @staticmethod
+    def _term_strengths(patches, weight) -> Optional[Dict[int, list]]:
+        """{id(patch value): [value, summed strength, scale, up2d, down2d]} or None."""
+        terms = HookPatchPlan.lora_terms(patches, weight)
+        if terms is None:
+            return None
+        result = {}
+        for v, strength, scale, up2, down2 in terms:
+            entry = result.get(id(v))
+            if entry is None:
+                result[id(v)] = [v, strength, scale, up2, down2]
+            else:
+                entry[1] += strength
+        return result
+
+    @staticmethod
+    def repatch_current_hooks(patcher) -> bool:
+        """
+        Brings the weights of `patcher.current_hooks` up to date after a
+        keyframe changed hook strengths, without restoring from the backups.
+
+        For keys made only of plain LoRA terms, (new - old strength) *
+        alpha / rank * up @ down is added for each term whose strength moved;
+        keys where nothing moved are not touched, and keys whose terms all
+        reached 0 are restored from their backup. Other keys are recomputed
+        from their backup. Returns False, changing nothing, when the recorded
+        state no longer matches the model, or after INCREMENTAL_REPATCH_LIMIT
+        updates; the caller then falls back to a full re-patch. Keys
+        recomputed from their backup go to the patched-weight cache; keys
+        updated by deltas carry rounding drift and are not cached.
+        """
+        limit = MadPatcherOverrides.INCREMENTAL_REPATCH_LIMIT
+        state = getattr(patcher, "_mad_patch_state", None)
+        hooks = patcher.current_hooks
+        if (
+            limit <= 0
+            or state is None
+            or hooks is None
+            or state["hooks"] is not hooks
+            or state["updates"] >= limit
+        ):
+            return False
+
+        combined_patches = patcher.get_combined_hook_patches(hooks=hooks)
+        cache = MadPatcherOverrides.WEIGHT_CACHE
+        records = state["keys"]
+        if any(key not in records for key in combined_patches):
+            return False
+
+        current = {}
+        for key, record in records.items():
+            if key not in patcher.hook_backup:
+                return False
+            try:
+                weight, set_func, convert_func = get_key_weight(patcher.model, key)
+            except (AttributeError, KeyError):
+                return False
+            if weight is not record["param"] or weight.data_ptr() != record["ptr"]:
+                return False
+            current[key] = (weight, set_func, convert_func)
+
+        for key, record in records.items():
+            weight, set_func, convert_func = current[key]
+            patches = combined_patches.get(key, [])
+            old_terms = record["terms"]
+            new_terms = None
+            if old_terms is not None:
+                new_terms = MadPatcherOverrides._term_strengths(patches, weight)
+
+            if new_terms is not None:
+                changed = []
+                for tid in old_terms.keys() | new_terms.keys():
+                    old = old_terms.get(tid)
+                    new = new_terms.get(tid)
+                    delta = (new[1] if new else 0.0) - (old[1] if old else 0.0)
+                    if delta != 0.0:
+                        changed.append((delta, new or old))
+                record["terms"] = new_terms
+                if not changed:
+                    continue
+                if all(t[1] == 0.0 for t in new_terms.values()):
+                    backup = patcher.hook_backup[key][0]
+                    comfy.utils.copy_to_param(patcher.model, key, backup.to(weight.device))
+                    continue
+
+                exact = False
+                temp_weight = comfy.model_management.cast_to_device(
+                    weight, weight.device, torch.float32, copy=True
+                )
+                flat = temp_weight.view(weight.shape[0], -1)
+                for delta, (_, _, scale, up2, down2) in changed:
+                    up2 = comfy.model_management.cast_to_device(up2, weight.device, torch.float32)
+                    down2 = comfy.model_management.cast_to_device(down2, weight.device, torch.float32)
+                    flat.addmm_(up2, down2, alpha=delta * scale)
+                out_weight = temp_weight
+            else:
+                exact = True
+                temp_weight = comfy.model_management.cast_to_device(
+                    patcher.hook_backup[key][0], weight.device, torch.float32, copy=True
+                )
+                if convert_func is not None:
+                    temp_weight = convert_func(temp_weight, inplace=True)
+                out_weight = MadPatcherOverrides.optimized_calculate_weight(
+                    patches, temp_weight, key
+                )
+                record["terms"] = None
+
+            out_weight = MadPatcherOverrides._write_weight(
+                patcher, key, weight, set_func, out_weight
+            )
+            # Deltas carry rounding drift; only exact results are cached.
+            if exact and cache.enabled:
+                cache_key = MadPatcherOverrides._weight_cache_key(patcher, key, patches)
+                if cache_key is not None:
+                    cache.put(cache_key, out_weight)
+            del temp_weight, out_weight
+
+        state["updates"] += 1
+        return True
+
+    @staticmethod
+    def prepare_hook_patches_current_keyframe(self, *args, **kwargs):
+        """
+        Monkey-patch target for ModelPatcher.prepare_hook_patches_current_keyframe.
+        ComfyUI resets the current hooks (patch_hooks(None)) when a keyframe
+        changes, so every key is recomputed on the next step. Here the reset
+        is intercepted and the current hooks are updated incrementally
+        instead when possible. Groups with keyframes fitted to the run's
+        sampling steps (KeyframeSchedule.coalesce_hooks) are advanced by
+        their FittedKeyframes for the duration of the call.
+        """
+        fitted = []
+        if KeyframeSchedule.SNAP_TO_STEPS:
+            hook_group = kwargs.get("hook_group", args[1] if len(args) > 1 else None)
+            model_options = kwargs.get("model_options", args[2] if len(args) > 2 else None)
+            try:
+                fitted = KeyframeSchedule.coalesce_hooks(self, hook_group, model_options)
+            except Exception as e:
+                logging.warning(f"{LOG_PREFIX} Keyframe coalescing failed: {e}")
+
+        patcher_cls = type(self)
+        reset = []
+
+        def patch_hooks(hooks=None):
+            if hooks is None:
+                reset.append(True)
+            else:
+                patcher_cls.patch_hooks(self, hooks)
+
+        shadowed = self.__dict__.get("patch_hooks")
+        self.patch_hooks = patch_hooks
+        try:
+            for entry in fitted:
+                entry.group.prepare_current_keyframe = entry.prepare_current_keyframe
+            result = patcher_cls.prepare_hook_patches_current_keyframe(self, *args, **kwargs)
+        finally:
+            for entry in fitted:
+                entry.group.__dict__.pop("prepare_current_keyframe", None)
+            if shadowed is None:
+                del self.patch_hooks
+            else:
+                self.patch_hooks = shadowed
+
+        if reset:
+            updated = False
+            try:
+                # A fully cached re-patch is exact and cheaper than deltas.
+                if not MadPatcherOverrides._weight_cache_covers(self):
+                    updated = MadPatcherOverrides.repatch_current_hooks(self)
+            except Exception as e:
+                logging.warning(f"{LOG_PREFIX} Incremental re-patch failed, re-patching fully: {e}")
+            if not updated:
+                self.patch_hooks(None)
+        return result
+
     @staticmethod
     def patch_hook_weight_to_device(
         self,
@@ -795,6 +2090,9 @@ class MadPatcherOverrides:
     ):
         """
         Monkey-patch target for ModelPatcher.patch_hook_weight_to_device.
+        Keys found in the patched-weight cache are copied back as they are;
+        plain LoRA keys are computed in batches (see HookPatchPlan); any
+        other key goes through calculate_weight on its own.
         """
         import comfy.hooks
 
@@ -814,38 +2112,72 @@ class MadPatcherOverrides:
                 weight.device,
             )
 
-        temp_weight = comfy.model_management.cast_to_device(
-            weight, weight.device, torch.float32, copy=True
-        )
-        if convert_func is not None:
-            temp_weight = convert_func(temp_weight, inplace=True)
+        cache_key = cached = None
+        if MadPatcherOverrides.WEIGHT_CACHE.enabled:
+            lookups, found = MadPatcherOverrides._weight_cache_pass(self, combined_patches)
+            plan = MadPatcherOverrides._patch_plan(self, combined_patches, skip=found)
+            # Popped so the pass doesn't keep evicted weights alive.
+            entry = lookups.pop(key, None)
+            if entry is not None:
+                cache_key, cached = entry
+        else:
+            plan = MadPatcherOverrides._patch_plan(self, combined_patches)
+
+        batched = None
+        if cached is None and plan is not None:
+            batched = plan.take(key, weight)
+        temp_weight = None
+        if cached is not None:
+            out_weight = cached
+        elif batched is not None:
+            out_weight = batched
+        else:
+            temp_weight = comfy.model_management.cast_to_device(
+                weight, weight.device, torch.float32, copy=True
+            )
+            if convert_func is not None:
+                temp_weight = convert_func(temp_weight, inplace=True)
 
-        out_weight = MadPatcherOverrides.optimized_calculate_weight(
-            combined_patches[key], temp_weight, key
-        )
+            out_weight = MadPatcherOverrides.optimized_calculate_weight(
+                combined_patches[key], temp_weight, key
+            )
 
         if original_weights is not None:
             del original_weights[key]
 
-        if set_func is None:
-            out_weight = comfy.float.stochastic_rounding(
-                out_weight, weight.dtype, seed=string_to_seed(key)
-            )
-            comfy.utils.copy_to_param(self.model, key, out_weight)
+        if cached is not None:
+            comfy.utils.copy_to_param(self.model, key, cached)
         else:
-            set_func(out_weight, inplace_update=True, seed=string_to_seed(key))
+            out_weight = MadPatcherOverrides._write_weight(
+                self, key, weight, set_func, out_weight
+            )
+            if cache_key is not None:
+                MadPatcherOverrides.WEIGHT_CACHE.put(cache_key, out_weight)
+        MadPatcherOverrides._record_patch(
+            self, hooks, combined_patches, key, weight, set_func, convert_func
+        )
 
         if self.hook_mode == comfy.hooks.EnumHookMode.MaxSpeed:
             target_device = self.offload_device
             used = memory_counter.use(weight)
             if used:
                 target_device = weight.device
+            # A batched result may still live in the shared scratch buffer.
+            shared = (
+                batched is not None
+                and out_weight.untyped_storage().data_ptr()
+                == batched.untyped_storage().data_ptr()
+            )
             self.cached_hook_patches.setdefault(hooks, {})
             self.cached_hook_patches[hooks][key] = (
-                out_weight.to(device=target_device, copy=False),
+                out_weight.to(device=target_device, copy=shared or cached is not None),
                 weight.device,
             )
 
+        if plan is not None and plan.finished:
+            # Frees the scratch buffers before sampling starts.
+            plan.release()
+
         del temp_weight
         del out_weight
         del weight
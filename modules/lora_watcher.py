@@ -0,0 +1,240 @@
+import os
+import time
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import folder_paths
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+
+    HAS_WATCHDOG = True
+except ImportError:
+    HAS_WATCHDOG = False
+
+LOG_PREFIX = "[MAD-NODES-WATCH]"
+
+ADDED = "added"
+MODIFIED = "modified"
+REMOVED = "removed"
+SIDECAR = "sidecar"
+
+SIDECAR_SUFFIXES = (".metadata.json", ".json")
+
+# Changes are collected for this long before listeners are called, so a
+# file being copied in is reported once instead of once per write.
+DEBOUNCE_SECONDS = 0.5
+
+
+def lora_extensions() -> set:
+    exts = getattr(folder_paths, "supported_pt_extensions", None)
+    if not exts:
+        exts = {".ckpt", ".pt", ".pt2", ".bin", ".pth", ".safetensors", ".pkl", ".sft"}
+    return {e.lower() for e in exts}
+
+
+def sidecar_stem(path: str) -> Optional[str]:
+    """Stem of the LoRA a sidecar file belongs to, or None for other files."""
+    name = os.path.basename(path)
+    lower = name.lower()
+    for suffix in SIDECAR_SUFFIXES:
+        if lower.endswith(suffix):
+            return name[: -len(suffix)]
+    return None
+
+
+class LoraWatcher:
+    """
+    Watches the `loras` folders and reports added, modified and removed
+    LoRA and sidecar files to registered listeners, as one batch of
+    {absolute path: kind} per debounce window.
+
+    Uses watchdog (inotify on Linux) when it is installed and falls back to
+    polling (size, mtime_ns) snapshots every `interval` seconds otherwise.
+    """
+
+    def __init__(self, interval: float = 10.0, use_watchdog: bool = True):
+        self.interval = max(1.0, float(interval))
+        self.use_watchdog = use_watchdog and HAS_WATCHDOG
+        self._listeners: List[Callable[[Dict[str, str]], None]] = []
+        self._pending: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._observer = None
+        self._snapshot: Dict[str, Tuple[int, int]] = {}
+        self._exts = lora_extensions()
+        self.mode = None
+
+    def add_listener(self, listener: Callable[[Dict[str, str]], None]) -> None:
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    @staticmethod
+    def roots() -> List[str]:
+        try:
+            paths = folder_paths.get_folder_paths("loras")
+        except Exception:
+            return []
+        return [os.path.abspath(p) for p in paths if os.path.isdir(p)]
+
+    def is_relevant(self, path: str) -> bool:
+        if sidecar_stem(path) is not None:
+            return True
+        return os.path.splitext(path)[1].lower() in self._exts
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop.clear()
+        self.mode = "polling"
+        if self.use_watchdog:
+            try:
+                self._start_observer()
+                self.mode = "watchdog"
+            except Exception as e:
+                logging.warning(f"{LOG_PREFIX} watchdog unavailable, polling instead: {e}")
+                self._observer = None
+        if self.mode == "polling":
+            self._snapshot = self._scan()
+        self._thread = threading.Thread(
+            target=self._run, name="mad-nodes-watcher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._observer is not None:
+            try:
+                self._observer.stop()
+            except Exception:
+                pass
+            self._observer = None
+
+    def notify(self, path: str, kind: str) -> None:
+        """Queues one change; a file added and then written to stays ADDED."""
+        path = os.path.abspath(path)
+        if not self.is_relevant(path):
+            return
+        with self._lock:
+            previous = self._pending.get(path)
+            if previous == ADDED and kind == MODIFIED:
+                kind = ADDED
+            self._pending[path] = kind
+        self._wake.set()
+
+    def lora_changes(self, changes: Dict[str, str]) -> Dict[str, str]:
+        """
+        Maps a batch of raw changes onto LoRA files. A changed sidecar is
+        reported as SIDECAR for every LoRA in the same folder with its stem.
+        """
+        result = {}
+        for path, kind in changes.items():
+            stem = sidecar_stem(path)
+            if stem is None:
+                result[path] = kind
+                continue
+            folder = os.path.dirname(path)
+            for ext in self._exts:
+                candidate = os.path.join(folder, stem + ext)
+                if candidate not in result and os.path.isfile(candidate):
+                    result[candidate] = SIDECAR
+        return result
+
+    def _start_observer(self) -> None:
+        watcher = self
+
+        class _Handler(FileSystemEventHandler):
+            def on_created(self, event):
+                if not event.is_directory:
+                    watcher.notify(event.src_path, ADDED)
+
+            def on_modified(self, event):
+                if not event.is_directory:
+                    watcher.notify(event.src_path, MODIFIED)
+
+            def on_deleted(self, event):
+                if not event.is_directory:
+                    watcher.notify(event.src_path, REMOVED)
+
+            def on_moved(self, event):
+                if not event.is_directory:
+                    watcher.notify(event.src_path, REMOVED)
+                    watcher.notify(event.dest_path, ADDED)
+
+        observer = Observer()
+        handler = _Handler()
+        for root in self.roots():
+            observer.schedule(handler, root, recursive=True)
+        observer.daemon = True
+        observer.start()
+        self._observer = observer
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        for root in self.roots():
+            for dirpath, _, filenames in os.walk(root, followlinks=True):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    if not self.is_relevant(path):
+                        continue
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    snapshot[path] = (st.st_size, st.st_mtime_ns)
+        return snapshot
+
+    def _poll(self) -> None:
+        current = self._scan()
+        previous = self._snapshot
+        self._snapshot = current
+        for path, sig in current.items():
+            old = previous.get(path)
+            if old is None:
+                self.notify(path, ADDED)
+            elif old != sig:
+                self.notify(path, MODIFIED)
+        for path in previous.keys() - current.keys():
+            self.notify(path, REMOVED)
+
+    def _run(self) -> None:
+        next_poll = time.monotonic() + self.interval
+        while not self._stop.is_set():
+            timeout = None
+            if self.mode == "polling":
+                timeout = max(0.0, next_poll - time.monotonic())
+            self._wake.wait(timeout)
+            if self._stop.is_set():
+                break
+
+            if self.mode == "polling" and time.monotonic() >= next_poll:
+                try:
+                    self._poll()
+                except Exception as e:
+                    logging.warning(f"{LOG_PREFIX} Poll failed: {e}")
+                next_poll = time.monotonic() + self.interval
+
+            if self._wake.is_set():
+                self._wake.clear()
+                self._stop.wait(DEBOUNCE_SECONDS)
+                self._flush()
+
+    def _flush(self) -> None:
+        with self._lock:
+            changes, self._pending = self._pending, {}
+        if not changes:
+            return
+        for listener in list(self._listeners):
+            try:
+                listener(changes)
+            except Exception as e:
+                logging.warning(f"{LOG_PREFIX} Listener failed: {e}")
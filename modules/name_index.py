@@ -0,0 +1,170 @@
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import folder_paths
+
+
+def _normalize(rel: str) -> str:
+    return str(Path(rel)).replace("\\", "/").lower()
+
+
+class _CategoryIndex:
+    """Lookup tables over one folder_paths category's filename list."""
+
+    def __init__(self, category: str):
+        self.category = category
+        self.token = None
+        self.order: Dict[str, int] = {}
+        self.entries: Dict[str, Tuple[str, str, str]] = {}
+        self.by_stem: Dict[str, List[str]] = {}
+        self.by_norm: Dict[str, List[str]] = {}
+
+    def refreshed(self, available: List[str], token) -> "_CategoryIndex":
+        """
+        Index over `available` built from this one: only added and removed
+        entries are (re)parsed. This index is left as it is for lookups that
+        still use it.
+        """
+        new = _CategoryIndex(self.category)
+        new.entries = dict(self.entries)
+        new.by_stem = dict(self.by_stem)
+        new.by_norm = dict(self.by_norm)
+
+        current = set(available)
+        removed = [rel for rel in self.entries if rel not in current]
+        added = [rel for rel in available if rel not in self.entries]
+
+        for rel in removed:
+            _, stem, norm = new.entries.pop(rel)
+            self._unlink(new.by_stem, stem, rel)
+            self._unlink(new.by_norm, norm, rel)
+
+        for rel in added:
+            p = Path(rel)
+            stem = p.stem.lower()
+            norm = _normalize(rel)
+            new.entries[rel] = (p.name.lower(), stem, norm)
+            new.by_stem[stem] = new.by_stem.get(stem, []) + [rel]
+            new.by_norm[norm] = new.by_norm.get(norm, []) + [rel]
+
+        new.order = {rel: i for i, rel in enumerate(available)}
+        new.token = token
+        return new
+
+    @staticmethod
+    def _unlink(table: Dict[str, List[str]], key: str, rel: str) -> None:
+        bucket = [r for r in table.get(key, ()) if r != rel]
+        if bucket:
+            table[key] = bucket
+        else:
+            table.pop(key, None)
+
+    def _ordered(self, rels: Iterable[str]) -> List[str]:
+        return sorted(rels, key=self.order.__getitem__)
+
+    def _best(
+        self, name: str, stem_matches: bool, provided_norm: Optional[str] = None
+    ) -> Optional[str]:
+        target = Path(name)
+        target_base = target.name.lower()
+        if provided_norm is None:
+            provided_norm = _normalize(name)
+        has_dir = "/" in provided_norm
+
+        best, best_score = None, -1
+        for rel in self._ordered(self.by_stem.get(target.stem.lower(), ())):
+            name_lower, _, norm = self.entries[rel]
+            if name_lower == target_base:
+                score = 100
+            elif stem_matches:
+                score = 50
+            else:
+                continue
+            if has_dir and provided_norm in norm:
+                score += 25
+            if score > best_score:
+                best_score = score
+                best = rel
+        return best
+
+    def find(self, name: str) -> Optional[str]:
+        """
+        LoRA scoring: exact basename 100, stem 50, +25 when a provided
+        sub-path is part of the relative path. Ties keep list order.
+        """
+        return self._best(name, stem_matches=True)
+
+    def find_model(self, name: str) -> Optional[str]:
+        """
+        Checkpoint scoring: an exact relative path wins outright; otherwise
+        like `find`, except stems only match names given without extension.
+        """
+        provided_norm = _normalize(name)
+        exact = self.by_norm.get(provided_norm)
+        if exact:
+            return self._ordered(exact)[0]
+        return self._best(
+            name, stem_matches=Path(name).suffix == "", provided_norm=provided_norm
+        )
+
+
+class NameIndex:
+    """
+    Process-wide name index shared by all folder_paths categories.
+    An index is refreshed only when ComfyUI's own filename list changes, and
+    then only for the entries that were added or removed, so resolving a
+    name costs a dict lookup instead of a scan. A refresh builds a new index
+    and swaps it in, so a lookup never sees a partly updated one.
+    """
+
+    _lock = threading.Lock()
+    _indexes: Dict[str, _CategoryIndex] = {}
+
+    MODEL_CATEGORIES = ("checkpoints", "diffusion_models")
+
+    @staticmethod
+    def _source_token(category: str, available: List[str]):
+        cache = getattr(folder_paths, "filename_list_cache", None)
+        if isinstance(cache, dict) and category in cache:
+            return cache[category]
+        return tuple(available)
+
+    @classmethod
+    def get(cls, category: str) -> _CategoryIndex:
+        try:
+            available = folder_paths.get_filename_list(category)
+        except Exception:
+            available = []
+        token = cls._source_token(category, available)
+
+        with cls._lock:
+            index = cls._indexes.get(category)
+            if index is None:
+                index = _CategoryIndex(category)
+            if index.token is None or (
+                index.token is not token and index.token != token
+            ):
+                index = index.refreshed(available, token)
+                cls._indexes[category] = index
+            return index
+
+    @classmethod
+    def find(cls, category: str, name: str) -> Optional[str]:
+        if not name:
+            return None
+        return cls.get(category).find(name)
+
+    @classmethod
+    def find_model(cls, category: str, name: str) -> Optional[str]:
+        if not name:
+            return None
+        return cls.get(category).find_model(name)
+
+    @classmethod
+    def invalidate(cls, category: Optional[str] = None) -> None:
+        with cls._lock:
+            if category is None:
+                cls._indexes.clear()
+            else:
+                cls._indexes.pop(category, None)
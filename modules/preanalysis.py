@@ -0,0 +1,342 @@
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import folder_paths
+
+from .lora_inspector import LoRAInspector
+from .lora_ops import LoraOps
+from .settings import env_flag, env_float, env_int
+from .stats_store import LoraStatsStore
+
+LOG_PREFIX = "[MAD-NODES-PREANALYSIS]"
+
+EVENT_NAME = "mad-nodes.preanalysis"
+
+# Results are written to the stats store in groups of this size.
+WRITE_BATCH = 16
+
+
+def _init_worker() -> None:
+    # One intra-op thread per worker process, so N workers use ~N cores.
+    try:
+        import torch
+
+        torch.set_num_threads(1)
+    except Exception:
+        pass
+
+
+def _analyze_file(path_str: str) -> Tuple[str, str, Optional[Dict[str, Any]], Optional[str]]:
+    """Worker entry point: (path, arch, stats, error)."""
+    path = Path(path_str)
+    try:
+        arch = LoRAInspector.detect(path)
+        stats = LoraOps.compute_stats(path, arch)
+        return path_str, arch, stats, None
+    except Exception as e:
+        return path_str, "UNKNOWN", None, str(e)
+
+
+class PreAnalysisJob:
+    """
+    Background job that fills the persistent stats store for the whole
+    `loras` folder, so the Analysis panel rarely has to compute on demand.
+
+    Files with a valid store row (same size and mtime) are skipped. Work runs
+    on a thread pool, at most `workers` files in flight, with an optional
+    `delay` between submissions, and is paused while ComfyUI has prompts
+    queued so sampling keeps priority. `use_processes` forks worker processes
+    instead (POSIX only); forking the multi-threaded server can copy a held
+    lock into a child, so it is opt-in.
+    """
+
+    IDLE = "idle"
+    RUNNING = "running"
+    PAUSED = "paused"
+    CANCELLING = "cancelling"
+    CANCELLED = "cancelled"
+    DONE = "done"
+    ERROR = "error"
+
+    def __init__(
+        self,
+        store: LoraStatsStore,
+        info_cache=None,
+        workers: int = 1,
+        delay: float = 0.0,
+        use_processes: bool = False,
+        pause_when_busy: bool = True,
+    ):
+        self.store = store
+        self.info_cache = info_cache
+        self.workers = max(1, int(workers))
+        self.delay = max(0.0, float(delay))
+        self.use_processes = use_processes
+        self.pause_when_busy = pause_when_busy
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._status = self._empty_status(self.IDLE)
+        self._last_event = 0.0
+        self._extra: List[str] = []
+        self._accepting = False
+
+    @classmethod
+    def from_env(cls, store: LoraStatsStore, info_cache=None) -> "PreAnalysisJob":
+        return cls(
+            store,
+            info_cache,
+            workers=env_int("PREANALYZE_WORKERS", max(1, (os.cpu_count() or 1) // 4)),
+            delay=env_float("PREANALYZE_DELAY_MS", 0.0) / 1000.0,
+            use_processes=env_flag("PREANALYZE_PROCESSES", False),
+            pause_when_busy=env_flag("PREANALYZE_PAUSE_WHEN_BUSY", True),
+        )
+
+    @staticmethod
+    def _empty_status(state: str) -> Dict[str, Any]:
+        return {
+            "state": state,
+            "total": 0,
+            "queued": 0,
+            "done": 0,
+            "skipped": 0,
+            "failed": 0,
+            "current": None,
+            "started_at": None,
+            "elapsed": 0.0,
+            "eta": None,
+            "error": None,
+        }
+
+    @property
+    def running(self) -> bool:
+        thread = self._thread
+        return thread is not None and thread.is_alive()
+
+    def start(self, force: bool = False, paths: Optional[List[str]] = None) -> bool:
+        """
+        Starts the job over the whole folder, or over `paths` only.
+        Returns False if it is already running.
+        """
+        with self._lock:
+            return self._start_locked(force, paths)
+
+    def _start_locked(self, force: bool, paths: Optional[List[str]]) -> bool:
+        if self.running:
+            return False
+        self._accepting = True
+        self._cancel.clear()
+        self._status = self._empty_status(self.RUNNING)
+        self._status["started_at"] = time.time()
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(force, paths),
+            name="mad-nodes-preanalysis",
+            daemon=True,
+        )
+        self._thread.start()
+        return True
+
+    def enqueue(self, paths: List[str]) -> None:
+        """
+        Analyzes `paths` (when their stored stats are stale), joining the
+        running job if there is one.
+        """
+        paths = [os.path.abspath(str(p)) for p in paths]
+        if not paths:
+            return
+        with self._lock:
+            if self._accepting or self.running:
+                # A job that is already stopping picks these up on exit.
+                self._extra.extend(paths)
+            else:
+                self._start_locked(False, paths)
+
+    def cancel(self) -> bool:
+        """Requests cancellation; returns False if nothing is running."""
+        if not self.running:
+            return False
+        self._cancel.set()
+        self._update(state=self.CANCELLING)
+        return True
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            status = dict(self._status)
+        if status["started_at"] and status["state"] in (
+            self.RUNNING,
+            self.PAUSED,
+            self.CANCELLING,
+        ):
+            status["elapsed"] = time.time() - status["started_at"]
+        return status
+
+    def _update(self, notify: bool = False, **fields) -> None:
+        with self._lock:
+            self._status.update(fields)
+        if notify or time.time() - self._last_event >= 1.0:
+            self._notify()
+
+    def _notify(self) -> None:
+        self._last_event = time.time()
+        try:
+            import server
+
+            server.PromptServer.instance.send_sync(EVENT_NAME, self.status())
+        except Exception:
+            pass
+
+    @staticmethod
+    def _queue_busy() -> bool:
+        try:
+            import server
+
+            queue = server.PromptServer.instance.prompt_queue
+            return queue.get_tasks_remaining() > 0
+        except Exception:
+            return False
+
+    def _make_executor(self) -> Executor:
+        if self.use_processes and os.name == "posix":
+            try:
+                ctx = multiprocessing.get_context("fork")
+                return ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=ctx, initializer=_init_worker
+                )
+            except (ValueError, OSError) as e:
+                logging.warning(f"{LOG_PREFIX} Process pool unavailable, using threads: {e}")
+        return ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="mad-nodes-preanalysis"
+        )
+
+    def _pending_files(
+        self, force: bool, paths: Optional[List[str]] = None
+    ) -> Tuple[List[str], int]:
+        """Returns (files to analyze, total files considered)."""
+        if paths is None:
+            paths = []
+            for name in folder_paths.get_filename_list("loras"):
+                path = folder_paths.get_full_path("loras", name)
+                if path:
+                    paths.append(os.path.abspath(path))
+        paths = [p for p in dict.fromkeys(paths) if os.path.isfile(p)]
+        if force:
+            return paths, len(paths)
+        known = self.store.get_many(paths, None)
+        return [p for p in paths if p not in known], len(paths)
+
+    def _run(self, force: bool, paths: Optional[List[str]]) -> None:
+        executor = None
+        try:
+            pending, total = self._pending_files(force, paths)
+            self._update(
+                notify=True,
+                total=total,
+                queued=len(pending),
+                skipped=total - len(pending),
+            )
+            started = time.time()
+            in_flight: Dict[Any, str] = {}
+            results = []
+            done = failed = 0
+            queue = list(reversed(pending))
+
+            while not self._cancel.is_set():
+                with self._lock:
+                    extra, self._extra = self._extra, []
+                    if not extra and not queue and not in_flight:
+                        self._accepting = False
+                        break
+                if extra:
+                    extra, extra_total = self._pending_files(False, extra)
+                    extra = [p for p in extra if p not in queue]
+                    queue[:0] = reversed(extra)
+                    with self._lock:
+                        self._status["total"] += extra_total
+                        self._status["queued"] += len(extra)
+                        self._status["skipped"] += extra_total - len(extra)
+                if queue and executor is None:
+                    executor = self._make_executor()
+
+                while queue and len(in_flight) < self.workers and not self._cancel.is_set():
+                    if self.pause_when_busy and self._queue_busy():
+                        self._update(state=self.PAUSED)
+                        if in_flight:
+                            break
+                        self._cancel.wait(1.0)
+                        continue
+                    self._update(state=self.RUNNING)
+                    path_str = queue.pop()
+                    in_flight[executor.submit(_analyze_file, path_str)] = path_str
+                    self._update(current=os.path.basename(path_str))
+                    if self.delay:
+                        self._cancel.wait(self.delay)
+
+                if not in_flight:
+                    continue
+                finished, _ = wait(in_flight, timeout=1.0, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    path_str = in_flight.pop(fut)
+                    try:
+                        _, arch, stats, error = fut.result()
+                    except Exception as e:
+                        arch, stats, error = "UNKNOWN", None, str(e)
+                    if error or not stats:
+                        failed += 1
+                        if error:
+                            logging.warning(
+                                f"{LOG_PREFIX} {os.path.basename(path_str)}: {error}"
+                            )
+                    else:
+                        done += 1
+                        results.append((path_str, arch, stats))
+                        if self.info_cache is not None:
+                            self.info_cache.set(path_str, "arch", arch)
+
+                if len(results) >= WRITE_BATCH:
+                    self.store.put_many(results)
+                    results = []
+
+                finished_count = done + failed
+                rate = finished_count / max(time.time() - started, 1e-6)
+                remaining = len(queue) + len(in_flight)
+                self._update(
+                    done=done,
+                    failed=failed,
+                    eta=remaining / rate if rate > 0 else None,
+                )
+
+            if results:
+                self.store.put_many(results)
+
+            if self._cancel.is_set():
+                self._update(notify=True, state=self.CANCELLED, current=None, eta=None)
+            else:
+                self._update(notify=True, state=self.DONE, current=None, eta=0.0)
+        except Exception as e:
+            logging.error(f"{LOG_PREFIX} Pre-analysis failed: {e}")
+            self._update(notify=True, state=self.ERROR, error=str(e), current=None)
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+            with self._lock:
+                self._accepting = False
+                leftover, self._extra = self._extra, []
+                if self._status["started_at"]:
+                    self._status["elapsed"] = time.time() - self._status["started_at"]
+                self._thread = None
+                if leftover and not self._cancel.is_set():
+                    # Enqueued after the loop decided to stop.
+                    self._start_locked(False, leftover)
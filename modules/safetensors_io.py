@@ -0,0 +1,313 @@
+import os
+import json
+import mmap
+import struct
+import threading
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import torch
+
+from .file_cache import ValidatedLRU
+from .settings import env_int
+
+try:
+    import numpy as np
+
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+# Elements per reduction step; bounds the scratch buffers to 12 MiB.
+NORM_CHUNK = 1 << 20
+
+if HAS_NUMPY:
+    _NUMPY_DTYPES = {
+        "F32": np.float32,
+        "F16": np.float16,
+        "BF16": np.uint16,
+    }
+else:
+    _NUMPY_DTYPES = {}
+
+
+def read_header(path: Path) -> Tuple[Dict[str, Any], int]:
+    """Returns (parsed header, byte offset of the data section)."""
+    with open(path, "rb") as f:
+        header_len_bytes = f.read(8)
+        if len(header_len_bytes) != 8:
+            raise ValueError("Truncated safetensors header")
+        header_len = struct.unpack("<Q", header_len_bytes)[0]
+        if header_len > os.fstat(f.fileno()).st_size - 8:
+            raise ValueError("Truncated safetensors header")
+        header = json.loads(f.read(header_len))
+    return header, 8 + header_len
+
+
+class SafetensorsHeader:
+    """
+    Parsed safetensors header: per-tensor (dtype, shape, begin, end) in file
+    header order, the sorted key list, `__metadata__` and the byte offset of
+    the data section.
+    """
+
+    def __init__(self, header: Dict[str, Any], data_start: int):
+        if not isinstance(header, dict):
+            raise ValueError("Malformed safetensors header")
+        metadata = header.get("__metadata__")
+        self.metadata: Dict[str, Any] = metadata if isinstance(metadata, dict) else {}
+        self.data_start = data_start
+        self.tensors: Dict[str, Tuple[Optional[str], Tuple[int, ...], int, int]] = {}
+        for k, info in header.items():
+            if k == "__metadata__" or not isinstance(info, dict):
+                continue
+            begin, end = info.get("data_offsets", (0, 0))
+            self.tensors[k] = (
+                info.get("dtype"),
+                tuple(info.get("shape", ())),
+                begin,
+                end,
+            )
+        self.keys: List[str] = sorted(self.tensors)
+
+    def shape(self, key: str) -> Tuple[int, ...]:
+        return self.tensors[key][1]
+
+    def dtype(self, key: str) -> Optional[str]:
+        return self.tensors[key][0]
+
+
+class HeaderCache:
+    """
+    Process-wide cache of parsed safetensors headers, validated by
+    (size, mtime_ns), so architecture detection, key layouts and stats parse
+    each header once.
+    """
+
+    _cache = ValidatedLRU(max_entries=max(1, env_int("HEADER_CACHE_ENTRIES", 256)))
+
+    @classmethod
+    def get(cls, path: Path) -> SafetensorsHeader:
+        """Parsed header of `path`; raises OSError/ValueError like `read_header`."""
+        return cls._cache.get_or_load(path, cls._parse)
+
+    @staticmethod
+    def _parse(path_str: str) -> SafetensorsHeader:
+        return SafetensorsHeader(*read_header(Path(path_str)))
+
+    @classmethod
+    def invalidate(cls, path=None) -> None:
+        cls._cache.invalidate(path)
+
+    @classmethod
+    def on_files_changed(cls, changes: Dict[str, str]) -> None:
+        """LoraWatcher listener: drops headers of changed files."""
+        cls._cache.on_files_changed(changes)
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        return cls._cache.stats()
+
+
+_TORCH_DTYPES = {
+    name: getattr(torch, attr)
+    for name, attr in (
+        ("F64", "float64"),
+        ("F32", "float32"),
+        ("F16", "float16"),
+        ("BF16", "bfloat16"),
+        ("I64", "int64"),
+        ("I32", "int32"),
+        ("I16", "int16"),
+        ("I8", "int8"),
+        ("U8", "uint8"),
+        ("BOOL", "bool"),
+        ("F8_E4M3", "float8_e4m3fn"),
+        ("F8_E5M2", "float8_e5m2"),
+    )
+    if hasattr(torch, attr)
+}
+
+
+class LazyStateDict(Mapping):
+    """
+    Read-only state dict over a memory-mapped safetensors file.
+
+    Only the parsed header is held up front. A tensor is created on first
+    access as a view of the mapping, and its bytes are paged in from the file
+    when something actually reads them, so keys that are never used cost no
+    I/O and no anonymous memory. Tensors are memoized, so every access to a
+    key returns the same object.
+
+    The mapping is private (copy-on-write): an accidental in-place write
+    lands in a private page instead of failing or reaching the file.
+    `nbytes` is the size of the mapped tensor data. `close` releases the
+    mapping (and with it the file) once no tensor view is alive; a later
+    access maps the file again if it has not changed since.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.header = HeaderCache.get(self.path)
+        self.metadata = self.header.metadata
+        self.nbytes = sum(end - begin for _, _, begin, end in self.header.tensors.values())
+        self._tensors: Dict[str, torch.Tensor] = {}
+        self._lock = threading.Lock()
+        self._mm = None
+        self._signature = None
+        self._open()
+
+    def _open(self) -> None:
+        data_start = self.header.data_start
+        with open(self.path, "rb") as f:
+            st = os.fstat(f.fileno())
+            if self._signature is None:
+                for k, (dtype, _, begin, end) in self.header.tensors.items():
+                    if dtype not in _TORCH_DTYPES:
+                        raise ValueError(f"Unsupported dtype {dtype} for {k}")
+                    if not 0 <= begin <= end or data_start + end > st.st_size:
+                        raise ValueError(f"Tensor {k} lies outside the file")
+                self._signature = (st.st_size, st.st_mtime_ns)
+            elif (st.st_size, st.st_mtime_ns) != self._signature:
+                raise OSError(f"{self.path} changed on disk after it was opened")
+            self._mm = (
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+                if st.st_size > data_start
+                else None
+            )
+        self._closed = False
+
+    def close(self) -> None:
+        """
+        Drops the memoized tensors and this dict's reference to the mapping.
+        Tensor views keep the mapping alive, so the file is unmapped once the
+        last view handed out earlier is collected. Closing the mmap here
+        would leave those views pointing at unmapped memory.
+        """
+        with self._lock:
+            self._tensors.clear()
+            self._mm = None
+            self._closed = True
+
+    def __enter__(self) -> "LazyStateDict":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __getitem__(self, key: str) -> torch.Tensor:
+        tensor = self._tensors.get(key)
+        if tensor is not None:
+            return tensor
+        dtype, shape, begin, end = self.header.tensors[key]
+        torch_dtype = _TORCH_DTYPES[dtype]
+        with self._lock:
+            tensor = self._tensors.get(key)
+            if tensor is None:
+                if end == begin:
+                    tensor = torch.empty(shape, dtype=torch_dtype)
+                else:
+                    if self._closed:
+                        self._open()
+                    itemsize = torch.empty((), dtype=torch_dtype).element_size()
+                    tensor = torch.frombuffer(
+                        self._mm,
+                        dtype=torch_dtype,
+                        count=(end - begin) // itemsize,
+                        offset=self.header.data_start + begin,
+                    ).view(shape)
+                self._tensors[key] = tensor
+        return tensor
+
+    def __contains__(self, key) -> bool:
+        return key in self.header.tensors
+
+    def __iter__(self):
+        return iter(self.header.keys)
+
+    def __len__(self) -> int:
+        return len(self.header.tensors)
+
+
+def _sum_of_squares(mm, dtype: str, start: int, count: int, scratch) -> float:
+    """Sum of squares accumulated in float64, one chunk at a time."""
+    total = 0.0
+    np_dtype = _NUMPY_DTYPES[dtype]
+    itemsize = np.dtype(np_dtype).itemsize
+    wide, narrow = scratch
+    done = 0
+    while done < count:
+        n = min(NORM_CHUNK, count - done)
+        view = np.frombuffer(mm, dtype=np_dtype, count=n, offset=start + done * itemsize)
+        chunk = wide[:n]
+        if dtype == "BF16":
+            bits = narrow.view(np.uint32)[:n]
+            np.left_shift(view, 16, out=bits, dtype=np.uint32)
+            np.copyto(chunk, narrow[:n])
+        else:
+            np.copyto(chunk, view, casting="unsafe")
+        del view
+        total += float(np.dot(chunk, chunk))
+        done += n
+    return total
+
+
+def tensor_norms(
+    path: Path, keys: Optional[Iterable[str]] = None
+) -> Dict[str, float]:
+    """
+    Frobenius norms of F32/F16/BF16 tensors, computed directly over the
+    memory-mapped file without materializing torch tensors.
+    Scalars (0-d tensors) get 0.01, matching LoraOps.compute_stats.
+    Keys with other dtypes are left out for the caller to handle.
+    """
+    if not HAS_NUMPY:
+        return {}
+
+    header = HeaderCache.get(path)
+    data_start = header.data_start
+    wanted = keys if keys is not None else header.keys
+    # Walk the data section front to back so reads stay sequential.
+    wanted = sorted(
+        (k for k in wanted if k in header.tensors),
+        key=lambda k: header.tensors[k][2],
+    )
+
+    norms = {}
+    with open(path, "rb") as f:
+        size = f.seek(0, 2)
+        if size <= data_start:
+            mm = None
+        else:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if hasattr(mm, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+        try:
+            scratch = (
+                np.empty(NORM_CHUNK, dtype=np.float64),
+                np.empty(NORM_CHUNK, dtype=np.float32),
+            )
+            for k in wanted:
+                dtype, shape, begin, end = header.tensors[k]
+                if dtype not in _NUMPY_DTYPES:
+                    continue
+                if len(shape) == 0:
+                    norms[k] = 0.01
+                    continue
+                itemsize = np.dtype(_NUMPY_DTYPES[dtype]).itemsize
+                count = (end - begin) // itemsize
+                if count == 0 or mm is None:
+                    norms[k] = 0.0
+                    continue
+                sq = _sum_of_squares(mm, dtype, data_start + begin, count, scratch)
+                norms[k] = sq**0.5
+        finally:
+            if mm is not None:
+                try:
+                    mm.close()
+                except BufferError:
+                    # A view is still referenced by the traceback of an error
+                    # being raised; the mapping goes away with it.
+                    pass
+    return norms
@@ -0,0 +1,46 @@
+import os
+import logging
+
+LOG_PREFIX = "[MAD-NODES-SETTINGS]"
+ENV_PREFIX = "MAD_NODES_"
+
+
+def _raw(name: str):
+    value = os.environ.get(ENV_PREFIX + name)
+    if value is None or not value.strip():
+        return None
+    return value.strip()
+
+
+def env_int(name: str, default: int) -> int:
+    value = _raw(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        logging.warning(f"{LOG_PREFIX} Ignoring invalid {ENV_PREFIX}{name}={value!r}")
+        return default
+
+
+def env_float(name: str, default: float) -> float:
+    value = _raw(name)
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        logging.warning(f"{LOG_PREFIX} Ignoring invalid {ENV_PREFIX}{name}={value!r}")
+        return default
+
+
+def env_flag(name: str, default: bool = False) -> bool:
+    value = _raw(name)
+    if value is None:
+        return default
+    return value.lower() in ["1", "true", "yes", "on"]
+
+
+def env_str(name: str, default: str) -> str:
+    value = _raw(name)
+    return default if value is None else value
@@ -0,0 +1,99 @@
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .file_cache import ValidatedLRU
+from .settings import env_int
+
+
+class SidecarCache:
+    """
+    Process-wide cache of the fields this package reads from LoRA sidecar
+    JSON files (`<stem>.metadata.json`, `<stem>.json`).
+    Each file is parsed once per (size, mtime_ns); only the extracted fields
+    are kept, so large LoRA-Manager sidecars don't stay in memory.
+    """
+
+    _cache = ValidatedLRU(max_entries=max(1, env_int("SIDECAR_CACHE_ENTRIES", 4096)))
+
+    @staticmethod
+    def candidates(lora_path: Path) -> List[Path]:
+        """Sidecar paths for a LoRA, in the order they are consulted."""
+        return [
+            lora_path.with_name(f"{lora_path.stem}.metadata.json"),
+            lora_path.with_name(f"{lora_path.stem}.json"),
+        ]
+
+    @staticmethod
+    def _extract(data: Any) -> Dict[str, Any]:
+        if not isinstance(data, dict):
+            return {"trained_words": [], "tags": [], "base_models": []}
+
+        civitai = data.get("civitai")
+        if not isinstance(civitai, dict):
+            civitai = {}
+
+        trained_words = []
+        tw = data.get("trainedWords") or civitai.get("trainedWords")
+        if isinstance(tw, list):
+            trained_words = [str(t) for t in tw if isinstance(t, (str, int, float))]
+
+        tags = civitai.get("tags", [])
+        tags = [str(t) for t in tags] if isinstance(tags, list) else []
+
+        sources = [
+            data.get("baseModel"),
+            data.get("base_model"),
+            data.get("sd_version"),
+            data.get("modelspec.architecture"),
+            civitai.get("baseModel"),
+        ]
+        base_models = [str(v) for v in sources if v]
+
+        return {
+            "trained_words": trained_words,
+            "tags": tags,
+            "base_models": base_models,
+        }
+
+    @classmethod
+    def read(cls, json_path: Path) -> Optional[Dict[str, Any]]:
+        """
+        Extracted fields of one sidecar:
+        `trained_words`, civitai `tags` and `base_models` (base model fields in
+        priority order). Returns None if the file is missing or unreadable.
+        """
+        try:
+            return cls._cache.get_or_load(json_path, cls._load)
+        except (OSError, ValueError):
+            return None
+
+    @classmethod
+    def _load(cls, path_str: str) -> Dict[str, Any]:
+        with open(path_str, "r", encoding="utf-8") as f:
+            return cls._extract(json.load(f))
+
+    @classmethod
+    def for_lora(cls, lora_path: Path) -> List[Dict[str, Any]]:
+        """Extracted fields of every existing sidecar of a LoRA, in candidate order."""
+        results = []
+        for json_path in cls.candidates(Path(lora_path)):
+            fields = cls.read(json_path)
+            if fields is not None:
+                results.append(fields)
+        return results
+
+    @classmethod
+    def invalidate(cls, json_path=None) -> None:
+        cls._cache.invalidate(json_path)
+
+    @classmethod
+    def on_files_changed(cls, changes: Dict[str, str]) -> None:
+        """LoraWatcher listener: drops entries of changed sidecar files."""
+        for path in changes:
+            if path.lower().endswith(".json"):
+                cls.invalidate(path)
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        return cls._cache.stats()
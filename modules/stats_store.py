@@ -0,0 +1,203 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import folder_paths
+
+from .file_cache import file_signature
+
+LOG_PREFIX = "[MAD-NODES-STATS]"
+
+DB_FILENAME = ".mad_lora_stats.sqlite"
+
+
+class LoraStatsStore:
+    """
+    Persistent cache of LoraOps.compute_stats results.
+    Rows are keyed by (path, arch, version) and are only served while the
+    file's (size, mtime_ns) still match, so edits and replacements on disk
+    simply miss and get recomputed. Each thread keeps one connection open.
+    """
+
+    def __init__(self, db_path: str, version: str):
+        self.db_path = db_path
+        self.version = version
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    @classmethod
+    def default(cls, version: str) -> "LoraStatsStore":
+        try:
+            base_dir = folder_paths.get_user_directory()
+        except Exception:
+            base_dir = str(Path(__file__).resolve().parent.parent)
+        return cls(os.path.join(base_dir, DB_FILENAME), version)
+
+    @staticmethod
+    def _chunked(values, size: int):
+        for i in range(0, len(values), size):
+            yield values[i : i + size]
+
+    def _connection(self) -> sqlite3.Connection:
+        """This thread's connection; the schema is created by the first one."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=2.5)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=2500")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        with self._schema_lock:
+            if not self._schema_ready:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS lora_stats (
+                        path TEXT NOT NULL,
+                        arch TEXT NOT NULL,
+                        version TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        mtime_ns INTEGER NOT NULL,
+                        stats TEXT NOT NULL,
+                        updated_at REAL NOT NULL,
+                        PRIMARY KEY (path, arch, version)
+                    )
+                    """
+                )
+                self._schema_ready = True
+        self._local.conn = conn
+        return conn
+
+    def _discard_connection(self) -> None:
+        """Closes this thread's connection after an error; the next call reopens."""
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        self._schema_ready = False
+        if conn is not None:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def get(self, file_path, arch: str, version: Optional[str] = None):
+        path_str = os.path.abspath(str(file_path))
+        return self.get_many([path_str], arch, version).get(path_str)
+
+    def get_many(
+        self, file_paths: Iterable, arch: Optional[str], version: Optional[str] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns {absolute path: stats} for every file with a valid row.
+        With `arch=None`, the most recently written row of any arch is used.
+        """
+        version = version or self.version
+        signatures = {}
+        for file_path in file_paths:
+            sig = file_signature(file_path)
+            if sig is not None:
+                signatures[sig[0]] = sig[1:]
+        if not signatures:
+            return {}
+
+        results = {}
+        try:
+            with self._connection() as conn:
+                for chunk in self._chunked(list(signatures.keys()), 200):
+                    placeholders = ",".join("?" for _ in chunk)
+                    query = (
+                        "SELECT path, arch, size, mtime_ns, stats, updated_at FROM lora_stats "
+                        f"WHERE version = ? AND path IN ({placeholders})"
+                    )
+                    params = [version, *chunk]
+                    if arch is not None:
+                        query += " AND arch = ?"
+                        params.append(arch)
+                    query += " ORDER BY updated_at"
+                    for row in conn.execute(query, params):
+                        if (row["size"], row["mtime_ns"]) != signatures[row["path"]]:
+                            continue
+                        try:
+                            results[row["path"]] = json.loads(row["stats"])
+                        except json.JSONDecodeError:
+                            continue
+        except sqlite3.Error as e:
+            self._discard_connection()
+            logging.warning(f"{LOG_PREFIX} Stats lookup failed: {e}")
+        return results
+
+    def put(self, file_path, arch: str, stats: Dict[str, Any], version=None) -> None:
+        self.put_many([(file_path, arch, stats)], version)
+
+    def put_many(
+        self, rows: List[Tuple[Any, str, Dict[str, Any]]], version: Optional[str] = None
+    ) -> None:
+        version = version or self.version
+        updates = []
+        now = time.time()
+        for file_path, arch, stats in rows:
+            if not stats:
+                continue
+            sig = file_signature(file_path)
+            if sig is None:
+                continue
+            path_str, size, mtime_ns = sig
+            updates.append(
+                (path_str, arch, version, size, mtime_ns, json.dumps(stats), now)
+            )
+        if not updates:
+            return
+        try:
+            with self._connection() as conn:
+                for chunk in self._chunked(updates, 200):
+                    conn.execute("BEGIN IMMEDIATE")
+                    conn.executemany(
+                        """
+                        INSERT INTO lora_stats (path, arch, version, size, mtime_ns, stats, updated_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(path, arch, version) DO UPDATE SET
+                            size = excluded.size,
+                            mtime_ns = excluded.mtime_ns,
+                            stats = excluded.stats,
+                            updated_at = excluded.updated_at
+                        """,
+                        chunk,
+                    )
+                    conn.commit()
+        except sqlite3.Error as e:
+            self._discard_connection()
+            logging.warning(f"{LOG_PREFIX} Stats write failed: {e}")
+
+    def delete(self, file_paths: Iterable) -> None:
+        paths = [os.path.abspath(str(p)) for p in file_paths]
+        if not paths:
+            return
+        try:
+            with self._connection() as conn:
+                for chunk in self._chunked(paths, 200):
+                    placeholders = ",".join("?" for _ in chunk)
+                    conn.execute("BEGIN IMMEDIATE")
+                    conn.execute(
+                        f"DELETE FROM lora_stats WHERE path IN ({placeholders})", chunk
+                    )
+                    conn.commit()
+        except sqlite3.Error as e:
+            self._discard_connection()
+            logging.warning(f"{LOG_PREFIX} Stats delete failed: {e}")
+
+    def clear(self) -> None:
+        try:
+            with self._connection() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute("DELETE FROM lora_stats")
+                conn.commit()
+        except sqlite3.Error as e:
+            self._discard_connection()
+            logging.warning(f"{LOG_PREFIX} Stats clear failed: {e}")
@@ -1,18 +1,72 @@
 from __future__ import annotations
 import json
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 import comfy.hooks
-import comfy.utils
 import types
 
 from .modules.lora_inspector import LoRAInspector
-from .modules.lora_ops import LoraOps, MadPatcherOverrides
+from .modules.lora_ops import KeyframeSchedule, KeyLayout, LoraOps, MadPatcherOverrides
+from .modules.lora_cache import (
+    LoraInfoCache,
+    LoraTensorCache,
+    file_signature,
+    install_unload_hook,
+)
+from .modules.settings import env_flag, env_float
+from .modules.stats_store import LoraStatsStore
+from .modules.preanalysis import PreAnalysisJob
+from .modules.lora_watcher import ADDED, REMOVED, SIDECAR, LoraWatcher
+from .modules.name_index import NameIndex
+from .modules.safetensors_io import HeaderCache
+from .modules.sidecar_cache import SidecarCache
 
 NODE_DIR_NAME = Path(__file__).parent.name
 
 
-_LORA_CACHE = {}
+_LORA_CACHE = LoraInfoCache.from_env()
+_LORA_TENSOR_CACHE = LoraTensorCache.from_env()
+install_unload_hook(_LORA_TENSOR_CACHE)
+install_unload_hook(MadPatcherOverrides.WEIGHT_CACHE)
+_LBW_ZERO_COPY = env_flag("LBW_ZERO_COPY", True)
+_MERGE_SCHEDULES = env_flag("MERGE_SCHEDULES", False)
+_LORA_STATS_STORE = LoraStatsStore.default(LoraOps.get_ui_config()["config_version"])
+_PREANALYSIS_JOB = PreAnalysisJob.from_env(_LORA_STATS_STORE, _LORA_CACHE)
+_LORA_WATCHER = LoraWatcher(interval=env_float("WATCH_INTERVAL", 10.0))
+_WATCH_REANALYZE = env_flag("WATCH_REANALYZE")
+
+
+def _on_lora_files_changed(changes: Dict[str, str]) -> None:
+    """Drops cached results for exactly the LoRA files that changed."""
+    names_changed = False
+    reanalyze = []
+    removed = []
+    for path, kind in _LORA_WATCHER.lora_changes(changes).items():
+        _LORA_CACHE.invalidate(path)
+        if kind == SIDECAR:
+            # Sidecar metadata can change the detected arch, not the weights.
+            continue
+        _LORA_TENSOR_CACHE.invalidate(path)
+        if kind in (ADDED, REMOVED):
+            names_changed = True
+        if kind == REMOVED:
+            removed.append(path)
+        else:
+            reanalyze.append(path)
+
+    if names_changed:
+        NameIndex.invalidate("loras")
+    if removed:
+        _LORA_STATS_STORE.delete(removed)
+    if reanalyze and _WATCH_REANALYZE:
+        _PREANALYSIS_JOB.enqueue(reanalyze)
+
+
+_LORA_WATCHER.add_listener(HeaderCache.on_files_changed)
+_LORA_WATCHER.add_listener(SidecarCache.on_files_changed)
+_LORA_WATCHER.add_listener(_on_lora_files_changed)
+if env_flag("WATCH"):
+    _LORA_WATCHER.start()
 
 
 class MultiScheduledLoraLoader:
@@ -41,39 +95,166 @@ class MultiScheduledLoraLoader:
         if isinstance(file_path, str):
             file_path = Path(file_path)
 
-        path_str = str(file_path)
-        if (
-            not force_refresh
-            and path_str in _LORA_CACHE
-            and _LORA_CACHE[path_str].get("arch")
-        ):
-            return _LORA_CACHE[path_str]["arch"]
+        if not force_refresh:
+            arch = _LORA_CACHE.get(file_path, "arch")
+            if arch:
+                return arch
 
         arch = LoRAInspector.detect(file_path)
-        if path_str not in _LORA_CACHE:
-            _LORA_CACHE[path_str] = {}
-        _LORA_CACHE[path_str]["arch"] = arch
+        _LORA_CACHE.set(file_path, "arch", arch)
         return arch
 
     @classmethod
     def analyze_lora_weights(
-        cls, file_path: Path, force_refresh: bool = False, arch: str = "UNKNOWN"
+        cls,
+        file_path: Path,
+        force_refresh: bool = False,
+        arch: str = "UNKNOWN",
+        effective: bool = False,
     ) -> Optional[Dict[str, Any]]:
-        path_str = str(file_path)
-        if (
-            not force_refresh
-            and path_str in _LORA_CACHE
-            and _LORA_CACHE[path_str].get("stats")
-        ):
-            return _LORA_CACHE[path_str]["stats"]
-
-        stats = LoraOps.compute_stats(file_path, arch)
-
-        if path_str not in _LORA_CACHE:
-            _LORA_CACHE[path_str] = {}
-        _LORA_CACHE[path_str]["stats"] = stats
+        # Effective-delta stats are a separate result, cached side by side.
+        field = "stats:effective" if effective else "stats"
+        version = f"{_LORA_STATS_STORE.version}+effective" if effective else None
+
+        stats = None
+        if not force_refresh:
+            stats = _LORA_CACHE.get(file_path, field)
+            if stats:
+                return stats
+            stats = _LORA_STATS_STORE.get(file_path, arch, version)
+
+        if stats is None:
+            layout = cls.get_key_layout(file_path, arch)
+            stats = LoraOps.compute_stats(
+                file_path, arch, effective=effective, layout=layout
+            )
+            if stats:
+                _LORA_STATS_STORE.put(file_path, arch, stats, version)
+
+        _LORA_CACHE.set(file_path, field, stats)
         return stats
 
+    @classmethod
+    def get_key_layout(
+        cls, file_path: Path | str, arch: str, keys=None
+    ) -> Optional[KeyLayout]:
+        """
+        Cached KeyLayout of a file for `arch`. Keys come from `keys` or the
+        safetensors header; returns None when neither is available.
+        """
+        if isinstance(file_path, str):
+            file_path = Path(file_path)
+
+        field = f"layout:{arch}"
+        layout = _LORA_CACHE.get(file_path, field)
+        if layout is not None:
+            return layout
+
+        if keys is None:
+            keys = LoraOps.read_keys(file_path)
+            if keys is None:
+                return None
+        layout = KeyLayout.from_keys(keys, arch)
+        _LORA_CACHE.set(file_path, field, layout)
+        return layout
+
+    @classmethod
+    def refine_sdxl_arch(
+        cls,
+        file_path: Path,
+        arch: str,
+        stats: Optional[Dict[str, Any]],
+        effective: bool = False,
+    ) -> str:
+        """
+        SDXL lineage from weight stats. The thresholds are calibrated on
+        per-tensor energy, so effective-delta stats are not used for this.
+        """
+        if arch != "SDXL" or not stats:
+            return arch
+        if effective:
+            stats = cls.analyze_lora_weights(file_path, False, arch)
+        sub_arch = cls.classify_sdxl_lineage_from_stats(stats)
+        return sub_arch if sub_arch != "SDXL" else arch
+
+    @classmethod
+    def build_hooks(cls, stack) -> List[comfy.hooks.HookGroup]:
+        """
+        LoRA hooks for `stack` entries (path, cache variant, lora, strengths,
+        keyframes), one per entry in stack order. With MERGE_SCHEDULES,
+        entries with the same strengths and keyframes whose key naming is
+        compatible (LoraOps.key_roots) share one hook with a merged state
+        dict instead, so each weight is patched once instead of once per LoRA.
+        """
+        if not _MERGE_SCHEDULES:
+            return [
+                cls.make_hook(lora, p["strength_model"], p["strength_clip"], keyframes)
+                for _, _, lora, p, keyframes in stack
+            ]
+
+        groups: Dict[tuple, List[list]] = {}
+        for entry in stack:
+            _, _, lora, p, keyframes = entry
+            buckets = groups.setdefault(
+                (p["strength_model"], p["strength_clip"], tuple(keyframes)), []
+            )
+            roots = LoraOps.key_roots(lora)
+            for bucket in buckets:
+                if roots is not None and (roots <= bucket[0] or bucket[0] <= roots):
+                    bucket[0] = bucket[0] | roots
+                    bucket[1].append(entry)
+                    break
+            else:
+                buckets.append([roots, [entry]])
+
+        hooks = []
+        for (strength_model, strength_clip, keyframes), buckets in groups.items():
+            for _, entries in buckets:
+                loras = [entries[0][2]] if len(entries) == 1 else cls.merge_stack(entries)
+                for lora in loras:
+                    hooks.append(cls.make_hook(lora, strength_model, strength_clip, keyframes))
+        return hooks
+
+    @staticmethod
+    def make_hook(lora, strength_model, strength_clip, keyframes) -> comfy.hooks.HookGroup:
+        """LoRA hook with a keyframe group built from (start, strength) pairs."""
+        hook = comfy.hooks.create_hook_lora(lora, strength_model, strength_clip)
+        if keyframes:
+            grp = comfy.hooks.HookKeyframeGroup()
+            for start, strength in keyframes:
+                grp.add(comfy.hooks.HookKeyframe(strength=strength, start_percent=start))
+            hook.set_keyframes_on_hooks(grp)
+        return hook
+
+    @staticmethod
+    def merge_stack(entries) -> List[Dict[str, Any]]:
+        """
+        Merged state dict of several stack entries, followed by any residual
+        dicts. Merges without residuals are cached with the first file,
+        keyed by every file's version and cache variant. The merged dict is
+        counted in full, since it keeps the other files' tensors alive too.
+        """
+        members = []
+        for path, variant, _, _, _ in entries:
+            sig = file_signature(path)
+            if sig is None:
+                members = None
+                break
+            members.append(f"{sig[0]}:{sig[1]}:{sig[2]}:{variant}")
+        cache_variant = "merge:" + "|".join(members) if members else None
+
+        if cache_variant:
+            merged = _LORA_TENSOR_CACHE.get(entries[0][0], cache_variant)
+            if merged is not None:
+                return [merged]
+
+        loras = [entry[2] for entry in entries]
+        merged, residuals = LoraOps.merge_loras(loras)
+        residuals = [r for r in residuals if r]
+        if cache_variant and not residuals:
+            _LORA_TENSOR_CACHE.put(entries[0][0], merged, cache_variant)
+        return [merged] + residuals
+
     @staticmethod
     def classify_sdxl_lineage_from_stats(stats: Dict[str, Any]) -> str:
         return LoRAInspector.classify_sdxl_lineage_from_stats(stats)
@@ -142,7 +323,7 @@ class MultiScheduledLoraLoader:
             hooks_prepend = previous_hooks
             extract_trig = True
 
-        hooks, text_out, triggers_out = [], [], []
+        hooks, text_out, triggers_out, stack = [], [], [], []
 
         if extract_trig and str_prepend:
             for item in LoraOps.parse_external_string(str_prepend):
@@ -159,7 +340,8 @@ class MultiScheduledLoraLoader:
                 continue
 
             triggers_out.extend(LoraOps.extract_triggers(Path(path)))
-            lora = comfy.utils.load_torch_file(path, safe_load=True)
+            _LORA_TENSOR_CACHE.trim()
+            lora = _LORA_TENSOR_CACHE.load(path)
             if not lora:
                 continue
 
@@ -176,26 +358,33 @@ class MultiScheduledLoraLoader:
             if arch == "UNKNOWN":
                 arch = self.inspect_lora_architecture(Path(path))
 
+            layout = self.get_key_layout(path, arch, lora.keys())
+
             preset = item.get("preset")
             if preset:
-                stats = self.analyze_lora_weights(Path(path), arch=arch)
-                if stats:
-                    available_blocks = list(stats.get("energy_distribution", {}).keys())
-                    meta = stats.get("block_metadata", {})
-                    preset_vectors = LoraOps.get_vectors_for_preset(
-                        arch, preset, available_blocks, meta
-                    )
-
-                    preset_vectors.update(vectors)
-                    vectors = preset_vectors
+                preset_vectors = LoraOps.get_vectors_for_preset(
+                    arch, preset, list(layout.block_tags), {}, layout
+                )
+                preset_vectors.update(vectors)
+                vectors = preset_vectors
 
             if vectors:
-                lora = LoraOps.apply_lbw(
-                    lora,
-                    arch,
-                    lora_name,
-                    vectors,
+                lbw_mode = "fold" if _LBW_ZERO_COPY else "copy"
+                lbw_variant = (
+                    f"lbw:{lbw_mode}:{arch}:{LoraOps.serialize_vectors(vectors)}"
                 )
+                weighted = _LORA_TENSOR_CACHE.get(path, lbw_variant)
+                if weighted is None:
+                    weighted = LoraOps.apply_lbw(
+                        lora,
+                        arch,
+                        lora_name,
+                        vectors,
+                        zero_copy=_LBW_ZERO_COPY,
+                        layout=layout,
+                    )
+                    _LORA_TENSOR_CACHE.put(path, weighted, lbw_variant, base=lora)
+                lora = weighted
 
             if abs(p["strength_model"]) < 1e-6 and abs(p["strength_clip"]) < 1e-6:
                 continue
@@ -222,19 +411,10 @@ class MultiScheduledLoraLoader:
                     ) + [{"x": 1.0, "y": 0.0}]
                 item["points"] = pts
 
-            hook = comfy.hooks.create_hook_lora(
-                lora, p["strength_model"], p["strength_clip"]
+            keyframes = KeyframeSchedule.simplify(pts) if pts else []
+            stack.append(
+                (path, lbw_variant if vectors else LoraTensorCache.RAW, lora, p, keyframes)
             )
-            if pts:
-                grp = comfy.hooks.HookKeyframeGroup()
-                for pt in pts:
-                    grp.add(
-                        comfy.hooks.HookKeyframe(
-                            strength=float(pt["y"]), start_percent=float(pt["x"])
-                        )
-                    )
-                hook.set_keyframes_on_hooks(grp)
-            hooks.append(hook)
 
             def fv(v):
                 return f"{v:.4f}".rstrip("0").rstrip(".")
@@ -262,6 +442,7 @@ class MultiScheduledLoraLoader:
                 f"<lora:{clean_name}:{str_model}:{str_clip}{pts_s}{extra_s}>"
             )
 
+        hooks.extend(self.build_hooks(stack))
         if hooks_prepend:
             hooks.insert(0, hooks_prepend)
         final_group = (
@@ -275,6 +456,10 @@ class MultiScheduledLoraLoader:
             model_out.patch_hook_weight_to_device = types.MethodType(
                 MadPatcherOverrides.patch_hook_weight_to_device, model_out
             )
+            if hasattr(model_out, "prepare_hook_patches_current_keyframe"):
+                model_out.prepare_hook_patches_current_keyframe = types.MethodType(
+                    MadPatcherOverrides.prepare_hook_patches_current_keyframe, model_out
+                )
             model_out.register_all_hook_patches(
                 final_group,
                 comfy.hooks.create_target_dict(comfy.hooks.EnumWeightTarget.Model),